@@ -0,0 +1,195 @@
+import argparse
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+
+import degrees
+from util import SearchStats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare node expansions of the degrees search engines."
+    )
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument("-n", "--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=50)
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--snapshot", action="store_true")
+    parser.add_argument("--landmarks", type=int, default=0)
+    parser.add_argument(
+        "--workers", default="",
+        help="comma-separated worker counts to measure batch throughput for"
+    )
+    parser.add_argument(
+        "--synthetic", default="", metavar="SIZES",
+        help="benchmark generated graphs with these comma-separated "
+             "numbers of people instead of a directory"
+    )
+    args = parser.parse_args()
+
+    if not args.synthetic:
+        benchmark_directory(args.directory, args)
+        return
+
+    for size in [int(size) for size in args.synthetic.split(",")]:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_graph(directory, size, args.seed)
+            print(f"\nSynthetic graph of {size} people")
+            benchmark_directory(directory, args)
+
+
+def benchmark_directory(directory, args):
+    """
+    Load `directory` and benchmark the engines on seeded random queries.
+    """
+    print("Loading data...")
+    start = time.perf_counter()
+    degrees.load_data(
+        directory, compact=args.compact, snapshot=args.snapshot,
+        landmark_count=args.landmarks
+    )
+    print(f"Data loaded in {time.perf_counter() - start:.2f} seconds.")
+
+    rng = random.Random(args.seed)
+    person_ids = sorted(degrees.people)
+    pairs = [
+        (rng.choice(person_ids), rng.choice(person_ids))
+        for _ in range(args.queries)
+    ]
+
+    engines = {
+        "bfs": degrees.shortest_path,
+        "bidirectional": degrees.bidirectional_shortest_path,
+    }
+    lengths = benchmark_engines(pairs, engines)
+    if args.landmarks:
+        benchmark_bounds(pairs, lengths["bfs"])
+
+    if args.workers:
+        benchmark_workers(pairs, [int(w) for w in args.workers.split(",")])
+
+
+def benchmark_engines(pairs, engines):
+    """
+    Print per-query search counters and latency percentiles for each
+    engine answering `pairs`. Returns each engine's path lengths.
+    """
+    lengths = {}
+    print(f"{'engine':<15}{'expanded':>10}{'lookups':>10}{'peak':>8}"
+          f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}")
+    for name, search in engines.items():
+        stats = SearchStats()
+        latencies = []
+        lengths[name] = []
+        for source, target in pairs:
+            start = time.perf_counter()
+            path = search(source, target, stats)
+            latencies.append(1000 * (time.perf_counter() - start))
+            lengths[name].append(None if path is None else len(path))
+
+        print(f"{name:<15}{stats.expanded / len(pairs):>10.1f}"
+              f"{stats.neighbor_lookups / len(pairs):>10.1f}"
+              f"{stats.frontier_peak:>8}"
+              f"{percentile(latencies, 50):>9.3f}"
+              f"{percentile(latencies, 90):>9.3f}"
+              f"{percentile(latencies, 99):>9.3f}")
+
+    if any(lengths[name] != lengths["bfs"] for name in lengths):
+        print("Warning: engines disagree on some path lengths.")
+    return lengths
+
+
+def percentile(values, p):
+    """
+    Returns the nearest-rank `p`th percentile of `values`.
+    """
+    values = sorted(values)
+    rank = max(1, -(-p * len(values) // 100))
+    return values[rank - 1]
+
+
+def benchmark_bounds(pairs, lengths):
+    """
+    Print how often the landmark bounds pin down the degrees of
+    separation of the connected `pairs`, whose true `lengths` are known,
+    how far each bound is from the truth on average, and their latency.
+    """
+    exact, below, above, latencies = 0, 0, 0, []
+    for (source, target), length in zip(pairs, lengths):
+        start = time.perf_counter()
+        bounds = degrees.distance_bounds(source, target)
+        latencies.append(1000 * (time.perf_counter() - start))
+        if length is None or bounds is None or bounds[1] is None:
+            continue
+        lower, upper = bounds
+        exact += lower == upper
+        below += length - lower
+        above += upper - length
+
+    connected = sum(1 for length in lengths if length is not None)
+    print(f"{'bounds':<15}{'exact':>10}{'lower gap':>10}{'upper gap':>10}"
+          f"{'p50 ms':>9}{'p99 ms':>9}")
+    print(f"{'landmarks':<15}{exact / max(connected, 1):>10.2f}"
+          f"{below / max(connected, 1):>10.2f}"
+          f"{above / max(connected, 1):>10.2f}"
+          f"{percentile(latencies, 50):>9.3f}"
+          f"{percentile(latencies, 99):>9.3f}")
+
+
+def benchmark_workers(pairs, worker_counts):
+    """
+    Print batch throughput for `pairs` with each number of workers.
+    """
+    rows = io.StringIO()
+    csv.writer(rows).writerows(pairs)
+
+    print(f"{'workers':<15}{'queries/s':>12}{'seconds':>10}")
+    for workers in worker_counts:
+        rows.seek(0)
+        start = time.perf_counter()
+        degrees.batch(rows, io.StringIO(), workers)
+        elapsed = time.perf_counter() - start
+        print(f"{workers:<15}{len(pairs) / elapsed:>12.1f}{elapsed:>10.3f}")
+
+
+def generate_graph(directory, size, seed):
+    """
+    Write people.csv, movies.csv and stars.csv for `size` people and
+    half as many movies to `directory`. Casts of 2 to 6 are drawn half
+    uniformly and half in proportion to how many movies people have
+    already been in, so a few people become hubs as in the real data.
+    """
+    rng = random.Random(seed)
+    with open(os.path.join(directory, "people.csv"), "w",
+              encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "birth"])
+        for person in range(size):
+            writer.writerow([person, f"Person {person}", rng.randint(1920, 2010)])
+
+    appearances = []
+    with open(os.path.join(directory, "movies.csv"), "w",
+              encoding="utf-8", newline="") as movies, \
+            open(os.path.join(directory, "stars.csv"), "w",
+                 encoding="utf-8", newline="") as stars:
+        movie_writer = csv.writer(movies)
+        star_writer = csv.writer(stars)
+        movie_writer.writerow(["id", "title", "year"])
+        star_writer.writerow(["person_id", "movie_id"])
+        for movie in range(size // 2):
+            movie_writer.writerow([movie, f"Movie {movie}", rng.randint(1950, 2020)])
+            for _ in range(rng.randint(2, 6)):
+                if appearances and rng.random() < 0.5:
+                    person = rng.choice(appearances)
+                else:
+                    person = rng.randrange(size)
+                appearances.append(person)
+                star_writer.writerow([person, movie])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,525 @@
+import array
+import csv
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from util import UnionFind
+
+
+class StringTable():
+    """
+    A read-only sequence of strings packed into a single UTF-8 buffer,
+    with `offsets[i]:offsets[i + 1]` marking where string i lives.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        data = bytearray()
+        offsets = array.array("q", [0])
+        for string in strings:
+            data += string.encode("utf-8")
+            offsets.append(len(data))
+        return cls(bytes(data), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def index(self, string):
+        """
+        Returns the position of `string` in a table whose strings are
+        sorted, raising KeyError if it is not there.
+        """
+        i = bisect_left(self, string)
+        if i == len(self) or self[i] != string:
+            raise KeyError(string)
+        return i
+
+
+class CompactGraph():
+    """
+    The person-movie graph with every IMDb ID interned to a dense
+    integer, stored as two CSR adjacency lists:
+
+    person_movies[person_offsets[p]:person_offsets[p + 1]] are the movies
+    person p starred in, and movie_stars[movie_offsets[m]:movie_offsets[m + 1]]
+    are the people who starred in movie m.
+
+    components[p] labels the connected component person p is in.
+
+    `names`, `people` and `movies` give the same views as the dicts in
+    degrees.py, built from the packed tables on demand.
+    """
+
+    def __init__(self, person_ids, person_names, person_births,
+                 movie_ids, movie_titles, movie_years,
+                 person_offsets, person_movies, movie_offsets, movie_stars,
+                 name_order=None, components=None):
+        self.person_ids = person_ids
+        self.person_names = person_names
+        self.person_births = person_births
+        self.movie_ids = movie_ids
+        self.movie_titles = movie_titles
+        self.movie_years = movie_years
+        self.person_offsets = person_offsets
+        self.person_movies = person_movies
+        self.movie_offsets = movie_offsets
+        self.movie_stars = movie_stars
+        if components is None:
+            components = label_components(
+                len(person_ids), movie_offsets, movie_stars
+            )
+        self.components = components
+
+        self.names = NamesView(self, name_order)
+        self.people = PeopleView(self)
+        self.movies = MoviesView(self)
+
+    def person_index(self, person_id):
+        return self.person_ids.index(person_id)
+
+    def movie_index(self, movie_id):
+        return self.movie_ids.index(movie_id)
+
+    def movies_of(self, person):
+        return self.person_movies[
+            self.person_offsets[person]:self.person_offsets[person + 1]
+        ]
+
+    def stars_of(self, movie):
+        return self.movie_stars[
+            self.movie_offsets[movie]:self.movie_offsets[movie + 1]
+        ]
+
+    def neighbors(self, person):
+        """
+        Yields (movie, person) index pairs for people who starred
+        with person index `person`.
+        """
+        for movie in self.movies_of(person):
+            for star in self.stars_of(movie):
+                yield movie, star
+
+    def neighbors_for_person(self, person_id):
+        """
+        Same as degrees.neighbors_for_person, in IMDb IDs.
+        """
+        return {
+            (self.movie_ids[movie], self.person_ids[star])
+            for movie, star in self.neighbors(self.person_index(person_id))
+        }
+
+    def decode_path(self, path):
+        """
+        Converts a path of (movie, person) indexes into IMDb IDs.
+        """
+        if path is None:
+            return None
+        return [
+            (self.movie_ids[movie], self.person_ids[person])
+            for movie, person in path
+        ]
+
+
+class PeopleView(Mapping):
+    """
+    Maps person_ids to a dictionary of: name, birth, movies, built on
+    access from a CompactGraph.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, person_id):
+        graph = self.graph
+        person = graph.person_index(person_id)
+        return {
+            "name": graph.person_names[person],
+            "birth": graph.person_births[person],
+            "movies": {graph.movie_ids[m] for m in graph.movies_of(person)}
+        }
+
+    def __iter__(self):
+        return iter(self.graph.person_ids)
+
+    def __len__(self):
+        return len(self.graph.person_ids)
+
+
+class MoviesView(Mapping):
+    """
+    Maps movie_ids to a dictionary of: title, year, stars, built on
+    access from a CompactGraph.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, movie_id):
+        graph = self.graph
+        movie = graph.movie_index(movie_id)
+        return {
+            "title": graph.movie_titles[movie],
+            "year": graph.movie_years[movie],
+            "stars": {graph.person_ids[p] for p in graph.stars_of(movie)}
+        }
+
+    def __iter__(self):
+        return iter(self.graph.movie_ids)
+
+    def __len__(self):
+        return len(self.graph.movie_ids)
+
+
+class NamesView(Mapping):
+    """
+    Maps lowercased names to a set of corresponding person_ids, using
+    person indexes sorted by name that are only built on first use.
+    """
+
+    def __init__(self, graph, order=None):
+        self.graph = graph
+        self._order = order
+
+    def order(self):
+        if self._order is None:
+            names = self.graph.person_names
+            self._order = array.array("i", sorted(
+                range(len(names)), key=lambda p: names[p].lower()
+            ))
+        return self._order
+
+    def key(self, person):
+        return self.graph.person_names[person].lower()
+
+    def __getitem__(self, name):
+        order = self.order()
+        i = bisect_left(order, name, key=self.key)
+        person_ids = set()
+        while i < len(order) and self.key(order[i]) == name:
+            person_ids.add(self.graph.person_ids[order[i]])
+            i += 1
+        if not person_ids:
+            raise KeyError(name)
+        return person_ids
+
+    def __iter__(self):
+        previous = None
+        for person in self.order():
+            name = self.key(person)
+            if name != previous:
+                yield name
+                previous = name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+# Number of stars.csv rows sorted in memory at once while loading
+CHUNK_ROWS = 1000000
+
+# Number of pairs read back from a sorted run at a time
+RUN_BUFFER = 65536
+
+
+def load_compact(directory, chunk_rows=CHUNK_ROWS, progress=None, report=None):
+    """
+    Load the CSV files in `directory` into a CompactGraph.
+
+    stars.csv is read `chunk_rows` rows at a time, with each chunk
+    sorted and spilled to a temporary file, so its size only bounds
+    disk use. If given, `progress` is called with `report` after each
+    chunk, and `report` counts the star rows read, dropped because they
+    refer to unknown people or movies, and repeated.
+    """
+    if report is None:
+        report = {}
+    report.update(rows=0, dropped=0, duplicates=0)
+
+    # Load people, sorted by ID so IDs can be found by binary search
+    with open(f"{directory}/people.csv", encoding="utf-8") as f:
+        rows = sorted(
+            (row["id"], row["name"], row["birth"])
+            for row in csv.DictReader(f)
+        )
+    person_ids = StringTable.from_strings(row[0] for row in rows)
+    person_names = StringTable.from_strings(row[1] for row in rows)
+    person_births = StringTable.from_strings(row[2] for row in rows)
+    person_index = {row[0]: i for i, row in enumerate(rows)}
+
+    # Load movies
+    with open(f"{directory}/movies.csv", encoding="utf-8") as f:
+        rows = sorted(
+            (row["id"], row["title"], row["year"])
+            for row in csv.DictReader(f)
+        )
+    movie_ids = StringTable.from_strings(row[0] for row in rows)
+    movie_titles = StringTable.from_strings(row[1] for row in rows)
+    movie_years = StringTable.from_strings(row[2] for row in rows)
+    movie_index = {row[0]: i for i, row in enumerate(rows)}
+    del rows
+
+    # Load stars as (person, movie) pairs packed into single integers,
+    # in sorted runs of at most `chunk_rows` pairs
+    movie_count = len(movie_ids)
+    with tempfile.TemporaryDirectory() as scratch:
+        runs = []
+        chunk = array.array("q")
+        with open(f"{directory}/stars.csv", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                report["rows"] += 1
+                try:
+                    person = person_index[row["person_id"]]
+                    movie = movie_index[row["movie_id"]]
+                except KeyError:
+                    report["dropped"] += 1
+                    continue
+                chunk.append(person * movie_count + movie)
+                if len(chunk) >= chunk_rows:
+                    runs.append(write_run(chunk, scratch, len(runs)))
+                    chunk = array.array("q")
+                    if progress is not None:
+                        progress(report)
+        runs.append(write_run(chunk, scratch, len(runs)))
+        del chunk, person_index, movie_index
+        if progress is not None:
+            progress(report)
+
+        person_offsets, person_movies, movie_offsets, movie_stars = build_csr(
+            lambda: merge_runs(runs), len(person_ids), movie_count
+        )
+    report["duplicates"] = (
+        report["rows"] - report["dropped"] - len(person_movies)
+    )
+
+    return CompactGraph(
+        person_ids, person_names, person_births,
+        movie_ids, movie_titles, movie_years,
+        person_offsets, person_movies, movie_offsets, movie_stars
+    )
+
+
+def write_run(chunk, directory, number):
+    """
+    Sort the pairs in `chunk` and write them to a file in `directory`,
+    returning its name.
+    """
+    filename = os.path.join(directory, f"run{number}")
+    with open(filename, "wb") as f:
+        array.array("q", sorted(chunk)).tofile(f)
+    return filename
+
+
+def read_run(filename):
+    """
+    Yields the pairs in a file written by `write_run`.
+    """
+    with open(filename, "rb") as f:
+        while True:
+            block = array.array("q", f.read(8 * RUN_BUFFER))
+            if not block:
+                return
+            yield from block
+
+
+def merge_runs(runs):
+    """
+    Yields the pairs of every sorted run in order, without repeats.
+    """
+    previous = None
+    for pair in heapq.merge(*(read_run(run) for run in runs)):
+        if pair != previous:
+            yield pair
+            previous = pair
+
+
+def build_csr(read_pairs, person_count, movie_count):
+    """
+    Build both CSR adjacency lists from the `person * movie_count + movie`
+    pairs yielded in sorted order by each call to `read_pairs`.
+    """
+    person_offsets = array.array("q", bytes(8 * (person_count + 1)))
+    person_movies = array.array("i")
+    movie_offsets = array.array("q", bytes(8 * (movie_count + 1)))
+
+    # Pairs are sorted by person, so person rows can be filled in order
+    for pair in read_pairs():
+        person, movie = divmod(pair, movie_count)
+        person_offsets[person + 1] += 1
+        movie_offsets[movie + 1] += 1
+        person_movies.append(movie)
+    for p in range(person_count):
+        person_offsets[p + 1] += person_offsets[p]
+    for m in range(movie_count):
+        movie_offsets[m + 1] += movie_offsets[m]
+
+    # Movie rows are filled with a counting sort over a second pass
+    movie_stars = array.array("i", bytes(4 * len(person_movies)))
+    cursor = movie_offsets[:-1]
+    for pair in read_pairs():
+        person, movie = divmod(pair, movie_count)
+        movie_stars[cursor[movie]] = person
+        cursor[movie] += 1
+
+    return person_offsets, person_movies, movie_offsets, movie_stars
+
+
+def label_components(person_count, movie_offsets, movie_stars):
+    """
+    Returns an array labelling each person's connected component, found
+    by joining the stars of every movie with union-find.
+    """
+    sets = UnionFind(person_count)
+    for movie in range(len(movie_offsets) - 1):
+        stars = movie_stars[movie_offsets[movie]:movie_offsets[movie + 1]]
+        for star in stars[1:]:
+            sets.union(stars[0], star)
+    return sets.labels()
+
+
+# Snapshot files start with this magic string and format version, and
+# are only valid for the byte order they were written with
+SNAPSHOT_MAGIC = b"DEGREES\0"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_FILE = "degrees.snapshot"
+CSV_FILES = ("people.csv", "movies.csv", "stars.csv")
+
+
+def snapshot_key(directory):
+    """
+    Returns the sizes and modification times of the CSV files in
+    `directory`, which a snapshot must match to be used.
+    """
+    key = []
+    for filename in CSV_FILES:
+        stat = os.stat(os.path.join(directory, filename))
+        key += [stat.st_size, stat.st_mtime_ns]
+    return key
+
+
+def save_snapshot(graph, filename, key):
+    """
+    Write `graph` to `filename`, tagged with `key`.
+    """
+    sections = []
+    for table in (graph.person_ids, graph.person_names, graph.person_births,
+                  graph.movie_ids, graph.movie_titles, graph.movie_years):
+        sections += [table.data, table.offsets]
+    sections += [graph.person_offsets, graph.person_movies,
+                 graph.movie_offsets, graph.movie_stars,
+                 graph.names.order(), graph.components]
+    write_sections(filename, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, key, sections)
+
+
+def load_snapshot(filename, key):
+    """
+    Memory-map the snapshot in `filename` as a CompactGraph, or return
+    None if it is missing, from another version, or out of date.
+    """
+    sections = read_sections(filename, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, key)
+    if sections is None:
+        return None
+
+    tables = [
+        StringTable(sections[i], sections[i + 1].cast("q"))
+        for i in range(0, 12, 2)
+    ]
+    person_offsets, person_movies, movie_offsets, movie_stars = (
+        sections[12].cast("q"), sections[13].cast("i"),
+        sections[14].cast("q"), sections[15].cast("i")
+    )
+    return CompactGraph(
+        *tables, person_offsets, person_movies, movie_offsets, movie_stars,
+        name_order=sections[16].cast("i"), components=sections[17].cast("i")
+    )
+
+
+def write_sections(filename, magic, version, key, sections):
+    """
+    Write a header of `magic`, `version`, the byte order and `key`,
+    followed by each buffer in `sections` aligned to 8 bytes.
+    """
+    header = struct.pack(
+        f"=8sI?{len(key)}q", magic, version, sys.byteorder == "little", *key
+    )
+
+    # Write to a temporary file first so a partly written file is
+    # never picked up by another process
+    temporary = f"{filename}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(header)
+        f.write(struct.pack("=I", len(sections)))
+        for section in sections:
+            data = memoryview(section).cast("B")
+            f.write(bytes(-f.tell() % 8))
+            f.write(struct.pack("=q", len(data)))
+            f.write(data)
+    os.replace(temporary, filename)
+
+
+def read_sections(filename, magic, version, key):
+    """
+    Memory-map a file written by `write_sections` and return its
+    sections as byte memoryviews, or None if it is missing or its
+    header does not match.
+    """
+    try:
+        with open(filename, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    header = struct.Struct(f"=8sI?{len(key)}q")
+    if len(mapped) < header.size + 4:
+        return None
+    stored_magic, stored_version, little, *stored_key = (
+        header.unpack_from(mapped)
+    )
+    if (stored_magic != magic or stored_version != version or
+            little != (sys.byteorder == "little") or stored_key != key):
+        return None
+
+    view = memoryview(mapped)
+    position = header.size
+    (count,) = struct.unpack_from("=I", mapped, position)
+    position += 4
+    sections = []
+    for _ in range(count):
+        position += -position % 8
+        (length,) = struct.unpack_from("=q", mapped, position)
+        position += 8
+        sections.append(view[position:position + length])
+        position += length
+    return sections
+
+
+def load_cached(directory, progress=None, report=None):
+    """
+    Load `directory` from its snapshot if it is up to date, otherwise
+    load the CSV files and write a new snapshot for next time.
+    """
+    key = snapshot_key(directory)
+    filename = os.path.join(directory, SNAPSHOT_FILE)
+    graph = load_snapshot(filename, key)
+    if graph is not None:
+        return graph
+
+    graph = load_compact(directory, progress=progress, report=report)
+    try:
+        save_snapshot(graph, filename, key)
+    except OSError:
+        # A read-only data directory just means no snapshot next time
+        pass
+    return graph
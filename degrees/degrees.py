@@ -1,7 +1,14 @@
+import argparse
 import csv
+import json
+import multiprocessing
 import sys
+from collections import Counter
 
-from util import Node, StackFrontier, QueueFrontier
+from compact import CHUNK_ROWS, load_cached, load_compact
+from landmarks import load_landmarks
+from nameindex import NameIndex
+from util import Node, StackFrontier, QueueFrontier, SearchStats, UnionFind
 
 # Tom Cruise (a few good men) -> Kevin Bacon (apollo 13) -> gary sinise
 
@@ -14,11 +21,67 @@ people = {}
 # Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
 movies = {}
 
+# Maps person_ids to a tuple of (movie_id, stars) pairs, where stars is a
+# tuple of the person_ids who starred in that movie
+costars = {}
 
-def load_data(directory):
+# Maps person_ids to a label shared by everyone in their connected component
+components = {}
+
+# The CompactGraph the data was loaded into, if any. When set, names,
+# people and movies are read-only views onto it.
+graph = None
+
+# The LandmarkIndex for `graph`, if one was requested
+landmarks = None
+
+# NameIndex over the keys of `names`, built the first time it is needed
+name_index = None
+
+
+def load_data(directory, compact=False, snapshot=False, landmark_count=0,
+              progress=None):
     """
     Load data from CSV files into memory.
+
+    If `compact` is true, the data is loaded into a CompactGraph of
+    integer IDs instead, which takes far less memory.
+
+    If `snapshot` is true, the CompactGraph is memory-mapped from a
+    binary snapshot in `directory`, which is written first if missing
+    or older than the CSV files.
+
+    If `landmark_count` is positive, the CompactGraph is also given a
+    LandmarkIndex over that many hub people, loaded from `directory` or
+    built and saved there, which distance_bounds uses to bound degrees of
+    separation without searching. Searches do not use it: their lower
+    bounds are too loose to prune anyone before the two ends of a
+    bidirectional search meet.
+
+    Returns a dict counting the stars.csv rows read, dropped because they
+    refer to unknown people or movies, and repeated; it is empty if the
+    graph came from a snapshot. If given, `progress` is called with these
+    counts after every CHUNK_ROWS rows of stars.csv and once at the end.
     """
+    global graph, landmarks, name_index, names, people, movies
+    name_index = None
+    report = {}
+    if compact or snapshot or landmark_count:
+        if snapshot:
+            graph = load_cached(directory, progress=progress, report=report)
+        else:
+            graph = load_compact(directory, progress=progress, report=report)
+        names, people, movies = graph.names, graph.people, graph.movies
+        costars.clear()
+        components.clear()
+        landmarks = None
+        if landmark_count:
+            landmarks = load_landmarks(directory, graph, landmark_count)
+        return report
+
+    graph, landmarks = None, None
+    names, people, movies = {}, {}, {}
+
     # Load people
     with open(f"{directory}/people.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -43,26 +106,161 @@ def load_data(directory):
                 "stars": set()
             }
 
-    # Load stars
+    # Load stars, counting rows that refer to unknown people or movies
+    report.update(rows=0, dropped=0, duplicates=0)
     with open(f"{directory}/stars.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            try:
-                people[row["person_id"]]["movies"].add(row["movie_id"])
-                movies[row["movie_id"]]["stars"].add(row["person_id"])
-            except KeyError:
-                pass
+            report["rows"] += 1
+            if progress is not None and report["rows"] % CHUNK_ROWS == 0:
+                progress(report)
+            person_id, movie_id = row["person_id"], row["movie_id"]
+            if person_id not in people or movie_id not in movies:
+                report["dropped"] += 1
+                continue
+            if movie_id in people[person_id]["movies"]:
+                report["duplicates"] += 1
+                continue
+            people[person_id]["movies"].add(movie_id)
+            movies[movie_id]["stars"].add(person_id)
+    if progress is not None:
+        progress(report)
+
+    build_index()
+    build_components()
+    return report
+
+
+def build_index():
+    """
+    Build the person -> movies -> co-stars adjacency index from the
+    `people` and `movies` dicts, so neighbors can be found without
+    scanning every movie.
+    """
+    costars.clear()
+    casts = {
+        movie_id: tuple(movie["stars"])
+        for movie_id, movie in movies.items()
+    }
+    for person_id, person in people.items():
+        costars[person_id] = tuple(
+            (movie_id, casts[movie_id]) for movie_id in person["movies"]
+        )
+
+
+def build_components():
+    """
+    Label every person's connected component by joining the stars of
+    each movie with union-find, so people in different components are
+    known to be unconnected without searching.
+    """
+    components.clear()
+    index = {person_id: i for i, person_id in enumerate(people)}
+    sets = UnionFind(len(index))
+    for movie in movies.values():
+        stars = [index[person_id] for person_id in movie["stars"]]
+        for star in stars[1:]:
+            sets.union(stars[0], star)
+    for person_id, i in index.items():
+        components[person_id] = sets.find(i)
+
+
+def connected(source, target):
+    """
+    Returns whether two person_ids are in the same connected component.
+    """
+    if graph is not None:
+        return (graph.components[graph.person_index(source)] ==
+                graph.components[graph.person_index(target)])
+    return components[source] == components[target]
+
+
+def component_stats():
+    """
+    Returns the number of people and components, the size of the
+    largest component, and the number of people connected to no one.
+    """
+    labels = graph.components if graph is not None else components.values()
+    sizes = Counter(labels)
+    return {
+        "people": sum(sizes.values()),
+        "components": len(sizes),
+        "largest": max(sizes.values(), default=0),
+        "isolated": sum(1 for size in sizes.values() if size == 1)
+    }
 
 
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
-
-    # Load data from files into memory
-    print("Loading data...")
-    load_data(directory)
-    print("Data loaded.")
+    parser = argparse.ArgumentParser(
+        description="Find the degrees of separation between two people."
+    )
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument(
+        "--bidirectional", action="store_true",
+        help="search from both people at once"
+    )
+    parser.add_argument(
+        "--compact", action="store_true",
+        help="store the graph as integer arrays to save memory"
+    )
+    parser.add_argument(
+        "--snapshot", action="store_true",
+        help="load the compact graph from a cached binary snapshot"
+    )
+    parser.add_argument(
+        "--landmarks", type=int, default=0, metavar="N",
+        help="print bounds on the degrees of separation from distances "
+             "to N precomputed hub people before searching"
+    )
+    parser.add_argument(
+        "--batch", nargs="?", const="-", metavar="FILE",
+        help="answer CSV source,target pairs from FILE (or stdin) as JSON lines"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of processes answering batch queries"
+    )
+    parser.add_argument(
+        "--stats", action="store_true",
+        help="report statistics about the loaded graph"
+    )
+    parser.add_argument(
+        "--progress", action="store_true",
+        help="report progress while reading stars.csv"
+    )
+    args = parser.parse_args()
+
+    # Load data from files into memory, keeping stdout for results in
+    # batch mode
+    log = sys.stderr if args.batch else sys.stdout
+    print("Loading data...", file=log)
+    def printProgress(report):
+        print(f"  {report['rows']} star rows read, "
+              f"{report['dropped']} dropped", file=log)
+
+    report = load_data(
+        args.directory, compact=args.compact, snapshot=args.snapshot,
+        landmark_count=args.landmarks,
+        progress=printProgress if args.progress else None
+    )
+    print("Data loaded.", file=log)
+    if args.stats:
+        if report:
+            print(f"{report['rows']} star rows read, {report['dropped']} "
+                  f"dropped, {report['duplicates']} repeated.", file=log)
+        stats = component_stats()
+        print(f"{stats['people']} people in {stats['components']} components "
+              f"(largest {stats['largest']}, {stats['isolated']} isolated).",
+              file=log)
+
+    if args.batch == "-":
+        batch(sys.stdin, sys.stdout, args.workers)
+        return
+    elif args.batch:
+        with open(args.batch, encoding="utf-8") as f:
+            batch(f, sys.stdout, args.workers)
+        return
+
     source = person_id_for_name(input("Name: "))
     if source is None:
         sys.exit("Person not found.")
@@ -70,7 +268,22 @@ def main():
     if target is None:
         sys.exit("Person not found.")
 
-    path = shortest_path(source, target)
+    bounds = None if landmarks is None else distance_bounds(source, target)
+    if bounds is not None:
+        lower, upper = bounds
+        print(f"Landmarks bound the degrees of separation between "
+              f"{lower} and {'?' if upper is None else upper}.")
+
+    stats = SearchStats() if args.stats else None
+    if args.bidirectional:
+        path = bidirectional_shortest_path(source, target, stats)
+    else:
+        path = shortest_path(source, target, stats)
+    if stats is not None:
+        layers = ", ".join(f"{t * 1000:.1f}" for t in sum(stats.layer_times, []))
+        print(f"Expanded {stats.expanded} people, looked up "
+              f"{stats.neighbor_lookups} neighbors, frontier peaked at "
+              f"{stats.frontier_peak}; layer times (ms): {layers}")
 
     if path is None:
         print("Not connected.")
@@ -85,27 +298,151 @@ def main():
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
-def shortest_path(source, target):
+def batch(infile, outfile, workers=1):
+    """
+    Answer every source,target row of the CSV file `infile`, writing one
+    JSON object per line to `outfile`. Rows are grouped by source so one
+    breadth-first search answers all of that source's targets, and each
+    group is written out as soon as it is answered.
+
+    Sources and targets may be person_ids or unambiguous names.
+
+    With more than one worker, groups are answered by a pool of forked
+    processes, which inherit the loaded data instead of having it
+    pickled and sent to them.
+    """
+    groups = {}
+    for row in csv.reader(infile):
+        if not row:
+            continue
+        if len(row) != 2:
+            writeRecord(outfile, {"row": row, "error": "Expected 2 fields."})
+            continue
+        groups.setdefault(row[0], []).append(row[1])
+
+    if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        print("Forking is not supported here, using one worker.",
+              file=sys.stderr)
+        workers = 1
+
+    if workers > 1:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(workers) as pool:
+            for records in pool.imap_unordered(answerItem, groups.items()):
+                for record in records:
+                    writeRecord(outfile, record)
+                outfile.flush()
+        return
+
+    for source, targets in groups.items():
+        for record in answerGroup(source, targets):
+            writeRecord(outfile, record)
+        outfile.flush()
+
+
+def answerItem(item):
+    """
+    Answers a (source, targets) item of a batch in a worker process.
+    """
+    return answerGroup(*item)
+
+
+def answerGroup(source, targets):
+    """
+    Returns a result record for each of `targets` from `source`.
+    """
+    source_id = resolvePerson(source)
+    target_ids = [resolvePerson(target) for target in targets]
+    if source_id is not None:
+        paths = shortest_paths(
+            source_id, {t for t in target_ids if t is not None}
+        )
+
+    records = []
+    for target, target_id in zip(targets, target_ids):
+        record = {"source": source, "target": target}
+        if source_id is None or target_id is None:
+            record["error"] = "Person not found."
+        else:
+            path = paths[target_id]
+            record["degrees"] = None if path is None else len(path)
+            record["path"] = path
+        records.append(record)
+    return records
+
+
+def writeRecord(outfile, record):
+    outfile.write(json.dumps(record) + "\n")
+
+
+def resolvePerson(value):
+    """
+    Returns the person_id for a person_id or an unambiguous name,
+    or None, without prompting.
+    """
+    if value in people:
+        return value
+    return person_id_for_name(value, interactive=False)
+
+
+def shortest_path(source, target, stats=None):
     """
     Returns the shortest list of (movie_id, person_id) pairs
     that connect the source to the target.
 
     If no possible path, returns None.
 
-    STATE: A movie and its various actors
-    ACTION: Move to a movie from one of those actors
+    If `stats` is a SearchStats, the search's counters are added to it.
+    """
+    if not connected(source, target):
+        return None
+    if graph is not None:
+        return graph.decode_path(breadthFirstSearch(
+            graph.person_index(source), graph.person_index(target),
+            graph.neighbors, stats
+        ))
+    return breadthFirstSearch(source, target, neighbors_for_person, stats)
+
 
+def distance_bounds(source, target):
     """
+    Returns (lower, upper) bounds on the degrees of separation between
+    two person_ids from the landmark index, without searching, or None
+    if they are not connected. The upper bound is None if no landmark
+    reaches them.
+
+    Raises ValueError unless the data was loaded with landmarks.
+    """
+    if landmarks is None:
+        raise ValueError("Distance bounds need data loaded with landmarks.")
+    if not connected(source, target):
+        return None
+    return landmarks.bounds(
+        graph.person_index(source), graph.person_index(target)
+    )
 
-    shortestPath = []
 
-    initialState = (None, source)
-    startNode = Node(initialState, None, actions(initialState))
+def breadthFirstSearch(source, target, neighbors, stats=None):
+    """
+    Breadth-first search from `source` to `target`, where `neighbors`
+    returns the (movie, person) pairs reachable from a person.
+
+    STATE: A person
+    ACTION: The movie that leads from the parent person to this one
+    """
+    if source == target:
+        return []
+    if stats is not None:
+        stats.begin()
+        neighbors = stats.counting(neighbors)
+
     frontier = QueueFrontier()
-    explored = []
+    frontier.add(Node(source, None, None))
+    explored = set()
 
-    currentNode = startNode
-    frontier.add(currentNode)
+    # People left to expand on the current layer, and people added
+    # for the next one
+    layerRemaining, nextLayerSize = 1, 0
 
     while True:
         # If there's no solution, return None
@@ -113,92 +450,238 @@ def shortest_path(source, target):
             return None
 
         currentNode = frontier.remove()
+        explored.add(currentNode.state)
 
-        if goal(currentNode, target):
-            returnSolution(currentNode, target)
+        for movie_id, person_id in neighbors(currentNode.state):
+            if person_id in explored or frontier.contains_state(person_id):
+                continue
 
-        nextActions = actions(currentNode.state)
+            node = Node(person_id, currentNode, movie_id)
 
-        for action in nextActions:
-            node = Node(
-                results(currentNode.state, action),
-                currentNode,
-                action
-            )
+            # Check the goal as soon as a person is generated, since every
+            # node on this layer is at the same distance from the source
+            if person_id == target:
+                if stats is not None:
+                    stats.next_layer()
+                return returnSolution(node)
+
+            frontier.add(node)
+            nextLayerSize += 1
+
+        layerRemaining -= 1
+        if layerRemaining == 0:
+            layerRemaining, nextLayerSize = nextLayerSize, 0
+            if stats is not None:
+                stats.frontier(layerRemaining)
+                stats.next_layer()
+
+
+def returnSolution(node):
+    """
+    Walk back up the parents of `node`, collecting the
+    (movie_id, person_id) pairs from the source to it.
+    """
+    shortestPath = []
 
-            if goal(node, target):
-                return returnSolution(node, target)
+    while node.parent is not None:
+        shortestPath.append((node.action, node.state))
+        node = node.parent
 
-            if node.state not in explored and not frontier.contains_state(node.state):
-                frontier.add(node)
+    shortestPath.reverse()
+    return shortestPath
 
-        explored.append(currentNode.state)
 
+def bidirectional_shortest_path(source, target, stats=None):
+    """
+    Returns the same path as `shortest_path`, but searches outward from
+    the source and the target at the same time, always growing the
+    smaller frontier by one whole layer, until the two searches meet.
 
-# If the first item in the tuple is the target, we're done
-def goal(node, target):
-    if target in node.state[1]:
-        return True
-    return False
+    If no possible path, returns None.
+    """
+    if not connected(source, target):
+        return None
+    if graph is not None:
+        return graph.decode_path(bidirectionalSearch(
+            graph.person_index(source), graph.person_index(target),
+            graph.neighbors, stats
+        ))
+    return bidirectionalSearch(source, target, neighbors_for_person, stats)
 
 
-def returnSolution(currentNode, target):
-    shortestPath = []
-    movieName = currentNode.state[0]
-    star = target
-    shortestPath.append((movieName, star))
+def bidirectionalSearch(source, target, neighbors, stats=None):
+    """
+    Bidirectional breadth-first search from `source` to `target`, where
+    `neighbors` returns the (movie, person) pairs reachable from a person.
+    """
+    if source == target:
+        return []
+    if stats is not None:
+        stats.begin()
+        neighbors = stats.counting(neighbors)
+
+    # Maps each reached person to the (movie_id, person_id) step that
+    # reached them, or None for the person a search started from
+    forward = {source: None}
+    backward = {target: None}
+    forwardLayer = [source]
+    backwardLayer = [target]
+
+    while forwardLayer and backwardLayer:
+        if len(forwardLayer) <= len(backwardLayer):
+            forwardLayer, meeting = expandLayer(
+                forwardLayer, forward, backward, neighbors
+            )
+        else:
+            backwardLayer, meeting = expandLayer(
+                backwardLayer, backward, forward, neighbors
+            )
+        if stats is not None:
+            stats.frontier(len(forwardLayer) + len(backwardLayer))
+            stats.next_layer()
 
-    while currentNode.parent != None:
-        star = currentNode.action[0]
-        currentNode = currentNode.parent
-        movieName = currentNode.state[0]
+        if meeting is not None:
+            return joinPaths(meeting, forward, backward)
 
-        # (movieName, actor/actress) is the value to append
-        shortestPath.append((movieName, star))
+    return None
 
-    shortestPath.reverse()
-    shortestPath = shortestPath[1:]
-    return shortestPath
 
-    # Returns all the next possible actions (which movie-cast node to explore)
+def expandLayer(layer, reached, otherReached, neighbors):
+    """
+    Expand every person in `layer`, recording how each new person was
+    reached. Returns the next layer and the first person also reached
+    by the other search, or None if the searches have not met yet.
 
+    The first meeting found is always on a shortest path: any shorter
+    connection would have been seen while building an earlier layer.
+    """
+    nextLayer = []
+    for person_id in layer:
+        for movie_id, neighbor in neighbors(person_id):
+            if neighbor in reached:
+                continue
+            reached[neighbor] = (movie_id, person_id)
+            if neighbor in otherReached:
+                return nextLayer, neighbor
+            nextLayer.append(neighbor)
 
-def actions(state):
-    nextActions = []
+    return nextLayer, None
 
-    if state[0] is not None:
-        stars = movies[state[0]]["stars"]
-        for star in stars:
-            starsMovies = getSourcesMovies(star)
-            for movie in starsMovies:
-                nextActions.append((star, movie))
-    else:
-        starsMovies = getSourcesMovies(state[1])
-        for movie in starsMovies:
-            nextActions.append((state[1], movie))
 
-    nextActions = set(nextActions)
-    return nextActions
+def joinPaths(meeting, forward, backward):
+    """
+    Join the source half and the target half of a bidirectional search
+    that met at `meeting` into one list of (movie_id, person_id) pairs.
+    """
+    shortestPath = []
+
+    person_id = meeting
+    while forward[person_id] is not None:
+        movie_id, parent = forward[person_id]
+        shortestPath.append((movie_id, person_id))
+        person_id = parent
+    shortestPath.reverse()
 
+    person_id = meeting
+    while backward[person_id] is not None:
+        movie_id, child = backward[person_id]
+        shortestPath.append((movie_id, child))
+        person_id = child
 
-# Returns the resulting state (a movie and its cast) based on which movie was chosen (the previous action)
-def results(state, action):
-    # "action" represents the movie we chose to explore
-    newStateMovie = action[1]
-    newMovieCast = movies[newStateMovie]["stars"]
-    newState = (newStateMovie, newMovieCast)
-    return newState
+    return shortestPath
 
 
-def person_id_for_name(name):
+def shortest_paths(source, targets, stats=None):
+    """
+    Returns a dict mapping each person_id in `targets` to its shortest
+    path from `source` (or None), found with a single breadth-first
+    search tree.
+    """
+    # Targets in other components would only make the search exhaust
+    # the source's component
+    paths = {target: None for target in targets}
+    targets = [t for t in targets if connected(source, t)]
+
+    if graph is not None:
+        encoded = {graph.person_index(t): t for t in targets}
+        parents = breadthFirstTree(
+            graph.person_index(source), encoded, graph.neighbors, stats
+        )
+        for t, target in encoded.items():
+            paths[target] = graph.decode_path(pathFromTree(parents, t))
+        return paths
+
+    parents = breadthFirstTree(source, targets, neighbors_for_person, stats)
+    for target in targets:
+        paths[target] = pathFromTree(parents, target)
+    return paths
+
+
+def breadthFirstTree(source, targets, neighbors, stats=None):
+    """
+    Breadth-first search outward from `source` one layer at a time until
+    every person in `targets` has been reached, or no one is left.
+    Returns a dict mapping each reached person to the (movie, person)
+    step that reached them, or None for the source.
+    """
+    if stats is not None:
+        stats.begin()
+        neighbors = stats.counting(neighbors)
+
+    parents = {source: None}
+    remaining = set(targets) - {source}
+    layer = [source]
+
+    while layer and remaining:
+        nextLayer = []
+        for person in layer:
+            for movie, neighbor in neighbors(person):
+                if neighbor not in parents:
+                    parents[neighbor] = (movie, person)
+                    remaining.discard(neighbor)
+                    nextLayer.append(neighbor)
+        layer = nextLayer
+        if stats is not None:
+            stats.frontier(len(layer))
+            stats.next_layer()
+
+    return parents
+
+
+def pathFromTree(parents, target):
+    """
+    Returns the path from the root of a breadth-first search tree
+    to `target`, or None if the search never reached it.
+    """
+    if target not in parents:
+        return None
+
+    path = []
+    while parents[target] is not None:
+        movie, parent = parents[target]
+        path.append((movie, target))
+        target = parent
+
+    path.reverse()
+    return path
+
+
+def person_id_for_name(name, interactive=True):
     """
     Returns the IMDB id for a person's name,
     resolving ambiguities as needed.
+
+    If not `interactive`, ambiguous names return None instead of
+    asking which person was meant.
     """
     person_ids = list(names.get(name.lower(), set()))
     if len(person_ids) == 0:
+        if interactive:
+            suggestPeople(name)
         return None
     elif len(person_ids) > 1:
+        if not interactive:
+            return None
         print(f"Which '{name}'?")
         for person_id in person_ids:
             person = people[person_id]
@@ -216,28 +699,48 @@ def person_id_for_name(name):
         return person_ids[0]
 
 
+def find_people(query, limit=10):
+    """
+    Returns up to `limit` person_ids whose names match `query` exactly,
+    are one typo away from it, or start with it, best matches first.
+    People sharing a name are ordered by how many movies they starred in.
+    """
+    global name_index
+    if name_index is None:
+        name_index = NameIndex(names)
+
+    person_ids = []
+    for name in name_index.search(query, limit):
+        person_ids += sorted(
+            names[name], key=lambda person_id: -len(people[person_id]["movies"])
+        )
+    return person_ids[:limit]
+
+
+def suggestPeople(name):
+    """
+    Print the closest names to one that was not found.
+    """
+    suggestions = [people[person_id]["name"] for person_id in find_people(name)]
+    if suggestions:
+        print(f"Did you mean: {', '.join(dict.fromkeys(suggestions))}?")
+
+
 def neighbors_for_person(person_id):
     """
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
     """
-    movie_ids = people[person_id]["movies"]
+    if graph is not None:
+        return graph.neighbors_for_person(person_id)
+
     neighbors = set()
-    for movie_id in movie_ids:
-        for person_id in movies[movie_id]["stars"]:
-            neighbors.add((movie_id, person_id))
+    for movie_id, stars in costars[person_id]:
+        for star in stars:
+            neighbors.add((movie_id, star))
     return neighbors
 
 
-def getSourcesMovies(source):
-    sourcesMovies = []
-    for movie in movies:
-        if source in movies[movie]["stars"]:
-            sourcesMovies.append(movie)
-
-    return sourcesMovies
-
-
 def printFrontier(frontier):
     i = len(frontier.frontier) - 1
     print("TOP of STACK")
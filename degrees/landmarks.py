@@ -0,0 +1,117 @@
+import array
+import os
+
+from compact import read_sections, snapshot_key, write_sections
+
+LANDMARKS_MAGIC = b"LANDMARK"
+LANDMARKS_VERSION = 2
+LANDMARKS_FILE = "degrees.landmarks"
+
+# Distance stored for people a landmark cannot reach
+UNREACHABLE = -1
+
+
+class LandmarkIndex():
+    """
+    Breadth-first distances from a few hub people ("landmarks") to
+    everyone in a CompactGraph.
+
+    distances[l * size + p] is the number of degrees between landmark l
+    and person p. By the triangle inequality, for any landmark
+    |d(l, s) - d(l, t)| <= d(s, t) <= d(l, s) + d(l, t).
+    """
+
+    def __init__(self, landmarks, distances):
+        self.landmarks = landmarks
+        self.distances = distances
+        self.size = len(distances) // len(landmarks) if landmarks else 0
+
+    def distances_from(self, person):
+        """
+        Returns the distance from each landmark to `person`.
+        """
+        return [
+            self.distances[l * self.size + person]
+            for l in range(len(self.landmarks))
+        ]
+
+    def bounds(self, source, target):
+        """
+        Returns (lower, upper) bounds on the degrees of separation
+        between `source` and `target`, which must be connected. The
+        upper bound is None if no landmark reaches them.
+        """
+        return self.bounds_to(source, self.distances_from(target))
+
+    def bounds_to(self, person, goal):
+        """
+        Returns bounds as `bounds` does, from `person` to the person
+        whose `distances_from` are `goal`, so a search can bound many
+        people's distance to the same goal without looking it up again.
+        """
+        lower, upper = 0, None
+        for s, t in zip(self.distances_from(person), goal):
+            if s == UNREACHABLE or t == UNREACHABLE:
+                continue
+            lower = max(lower, abs(s - t))
+            upper = s + t if upper is None else min(upper, s + t)
+        return lower, upper
+
+
+def breadth_first_distances(graph, source, distances, base):
+    """
+    Fill distances[base + p] with the distance from `source` to each
+    person p it can reach.
+    """
+    distances[base + source] = 0
+    layer = [source]
+    depth = 0
+    while layer:
+        depth += 1
+        nextLayer = []
+        for person in layer:
+            for _, neighbor in graph.neighbors(person):
+                if distances[base + neighbor] == UNREACHABLE:
+                    distances[base + neighbor] = depth
+                    nextLayer.append(neighbor)
+        layer = nextLayer
+
+
+def build_landmarks(graph, count):
+    """
+    Build a LandmarkIndex for `graph` using the `count` people who
+    starred in the most movies as landmarks.
+    """
+    size = len(graph.person_ids)
+    landmarks = sorted(
+        range(size),
+        key=lambda p: graph.person_offsets[p] - graph.person_offsets[p + 1]
+    )[:count]
+
+    distances = array.array("h", [UNREACHABLE]) * (size * len(landmarks))
+    for l, landmark in enumerate(landmarks):
+        breadth_first_distances(graph, landmark, distances, l * size)
+
+    return LandmarkIndex(array.array("i", landmarks), distances)
+
+
+def load_landmarks(directory, graph, count):
+    """
+    Load the landmark index for `directory` from disk if it is up to
+    date, otherwise build it from `graph` and save it for next time.
+    """
+    key = snapshot_key(directory) + [count]
+    filename = os.path.join(directory, LANDMARKS_FILE)
+    sections = read_sections(filename, LANDMARKS_MAGIC, LANDMARKS_VERSION, key)
+    if sections is not None:
+        return LandmarkIndex(sections[0].cast("i"), sections[1].cast("h"))
+
+    index = build_landmarks(graph, count)
+    try:
+        write_sections(
+            filename, LANDMARKS_MAGIC, LANDMARKS_VERSION, key,
+            [index.landmarks, index.distances]
+        )
+    except OSError:
+        pass
+    return index
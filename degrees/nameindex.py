@@ -0,0 +1,125 @@
+from bisect import bisect_left
+
+
+def deletions(name):
+    """
+    Returns every string one deletion away from `name`.
+    """
+    return {name[:i] + name[i + 1:] for i in range(len(name))}
+
+
+def one_edit(a, b):
+    """
+    Returns whether `a` and `b` are equal, or one deletion, transposition
+    of neighboring characters, replacement or insertion apart.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > 1:
+        return False
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+
+    # After the first difference, the rest must match, either with that
+    # character replaced or with it swapped with the next one
+    return (a[i + 1:] == b[i + 1:] or
+            a[i:i + 2] == b[i + 1:i + 2] + b[i:i + 1] and
+            a[i + 2:] == b[i + 2:])
+
+
+class NameIndex():
+    """
+    Lowercased names kept sorted for prefix completion, and hashed for
+    finding names one typo away from a query.
+
+    Typos are found by symmetric deletion: every string one deletion
+    away from a name is indexed once, so a query only needs its own
+    deletions looked up, rather than every replacement and insertion of
+    every character in the data.
+    """
+
+    def __init__(self, names):
+        self.sorted = sorted(names)
+        self.known = set(self.sorted)
+
+        # Maps each string one deletion away from a name to the name's
+        # position in `sorted`, or to a list of positions if it is one
+        # deletion away from several names, which saves a list per entry
+        self.deleted = {}
+        for i, name in enumerate(self.sorted):
+            for variant in deletions(name):
+                found = self.deleted.get(variant)
+                if found is None:
+                    self.deleted[variant] = i
+                elif isinstance(found, int):
+                    self.deleted[variant] = [found, i]
+                else:
+                    found.append(i)
+
+    def __contains__(self, name):
+        return name in self.known
+
+    def prefixed(self, prefix, limit):
+        """
+        Returns up to `limit` names starting with `prefix`, in
+        alphabetical order.
+        """
+        matches = []
+        i = bisect_left(self.sorted, prefix)
+        while (i < len(self.sorted) and len(matches) < limit and
+               self.sorted[i].startswith(prefix)):
+            matches.append(self.sorted[i])
+            i += 1
+        return matches
+
+    def indexed(self, variant):
+        """
+        Returns the positions of the names one deletion away from
+        `variant`.
+        """
+        found = self.deleted.get(variant, ())
+        return (found,) if isinstance(found, int) else found
+
+    def similar(self, name):
+        """
+        Returns the known names one deletion, transposition, replacement
+        or insertion away from `name`, including `name` itself if known.
+
+        A name one insertion away is one of `name`'s deletions, one
+        deletion away has `name` as one of its deletions, and one
+        replacement or transposition away shares a deletion with it,
+        which is then checked since some names sharing one are two
+        edits apart.
+        """
+        matches = {name} if name and name in self.known else set()
+        variants = deletions(name)
+        matches.update(variant for variant in variants if variant in self.known)
+        matches.update(self.sorted[i] for i in self.indexed(name))
+        for variant in variants:
+            for i in self.indexed(variant):
+                if one_edit(name, self.sorted[i]):
+                    matches.add(self.sorted[i])
+        return sorted(matches)
+
+    def search(self, query, limit=10):
+        """
+        Returns up to `limit` known names for `query`, ranked as: an
+        exact match, then names one typo away, then names that start
+        with the query.
+        """
+        query = query.lower()
+        ranked = [query] if query in self.known else []
+        ranked += self.similar(query)
+        ranked += self.prefixed(query, limit)
+
+        # Drop repeats while keeping the first, best ranked, position
+        seen = set()
+        names = []
+        for name in ranked:
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+        return names[:limit]
@@ -1,3 +1,8 @@
+import array
+import time
+from collections import deque
+
+
 class Node():
     def __init__(self, state, parent, action):
         self.state = state
@@ -7,13 +12,19 @@ class Node():
 
 class StackFrontier():
     def __init__(self):
-        self.frontier = []
+        self.frontier = deque()
+
+        # States currently in the frontier, for constant time lookups.
+        # Callers check contains_state before adding, so each state is
+        # in the frontier at most once.
+        self.states = set()
 
     def add(self, node):
         self.frontier.append(node)
+        self.states.add(node.state)
 
     def contains_state(self, state):
-        return any(node.state == state for node in self.frontier)
+        return state in self.states
 
     def empty(self):
         return len(self.frontier) == 0
@@ -22,8 +33,8 @@ class StackFrontier():
         if self.empty():
             raise Exception("empty frontier")
         else:
-            node = self.frontier[-1]
-            self.frontier = self.frontier[:-1]
+            node = self.frontier.pop()
+            self.states.discard(node.state)
             return node
 
 
@@ -33,6 +44,90 @@ class QueueFrontier(StackFrontier):
         if self.empty():
             raise Exception("empty frontier")
         else:
-            node = self.frontier[0]
-            self.frontier = self.frontier[1:]
+            node = self.frontier.popleft()
+            self.states.discard(node.state)
             return node
+
+
+class UnionFind():
+    """
+    Disjoint sets over the integers 0 to size - 1, joined by size with
+    path halving, so any sequence of unions and finds is near-linear.
+    """
+
+    def __init__(self, size):
+        self.parent = array.array("i", range(size))
+        self.size = array.array("i", [1]) * size
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def labels(self):
+        """
+        Returns an array giving the root of each element's set.
+        """
+        return array.array("i", (self.find(x) for x in range(len(self.parent))))
+
+
+class SearchStats():
+    """
+    Counters a search fills in when given as its `stats` argument:
+    people expanded, (movie, person) pairs looked up, the largest the
+    frontier grew, and the seconds spent on each layer of each search.
+    """
+
+    def __init__(self):
+        self.searches = 0
+        self.expanded = 0
+        self.neighbor_lookups = 0
+        self.frontier_peak = 0
+        self.layer_times = []
+        self.mark = None
+
+    def begin(self):
+        self.searches += 1
+        self.layer_times.append([])
+        self.mark = time.perf_counter()
+
+    def next_layer(self):
+        now = time.perf_counter()
+        self.layer_times[-1].append(now - self.mark)
+        self.mark = now
+
+    def frontier(self, size):
+        if size > self.frontier_peak:
+            self.frontier_peak = size
+
+    def counting(self, neighbors):
+        """
+        Returns `neighbors` wrapped to count each call as an expansion
+        and each pair it returns as a lookup.
+        """
+        def counted(person):
+            pairs = list(neighbors(person))
+            self.expanded += 1
+            self.neighbor_lookups += len(pairs)
+            return pairs
+        return counted
+
+    def as_dict(self):
+        return {
+            "searches": self.searches,
+            "expanded": self.expanded,
+            "neighbor_lookups": self.neighbor_lookups,
+            "frontier_peak": self.frontier_peak,
+            "layer_times": self.layer_times
+        }
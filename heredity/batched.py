@@ -0,0 +1,167 @@
+import array
+import itertools
+import math
+from operator import add, eq, mul, sub
+
+# Gene assignments are evaluated 3 ** BATCH_DIGITS at a time
+BATCH_DIGITS = 11
+
+
+def log_tables(people, names, probs):
+    """
+    Returns, for each person in `names`, the log probability of each
+    gene count they might have, given their parents' if they have any,
+    times the probability of their trait if it is known. A founder's
+    table is indexed by their gene count g, anyone else's by
+    g * 9 + mother's * 3 + father's.
+    """
+    passes = [probs["mutation"], 0.5, 1 - probs["mutation"]]
+
+    def evidence(person, genes):
+        trait = people[person]["trait"]
+        return 0 if trait is None else math.log(probs["trait"][genes][trait])
+
+    tables = []
+    for person in names:
+        if not people[person]["mother"] and not people[person]["father"]:
+            tables.append(array.array("d", (
+                math.log(probs["gene"][genes]) + evidence(person, genes)
+                for genes in range(3)
+            )))
+            continue
+
+        table = array.array("d")
+        for genes, mother, father in itertools.product(range(3), repeat=3):
+            m, f = passes[mother], passes[father]
+            p = (m * f if genes == 2 else
+                 m * (1 - f) + f * (1 - m) if genes == 1 else
+                 (1 - m) * (1 - f))
+            table.append(math.log(p) + evidence(person, genes))
+        tables.append(table)
+    return tables
+
+
+def gene_columns(digits, size):
+    """
+    Returns the gene count of each of the first `digits` people in each
+    of `size` consecutive assignments starting at a multiple of
+    3 ** digits. Assignment k gives person i the i-th base-3 digit of k.
+    """
+    columns = []
+    for i in range(digits):
+        run = 3 ** i
+        pattern = (array.array("b", [0]) * run + array.array("b", [1]) * run +
+                   array.array("b", [2]) * run)
+        columns.append(pattern * (size // (3 * run)))
+    return columns
+
+
+def scaled(column, factor):
+    return array.array("b", map(mul, column, itertools.repeat(factor)))
+
+
+def log_joint_probabilities(people, names, tables, genes, threes, nines):
+    """
+    Returns the log joint probability of the known traits for every
+    assignment in `genes`, a column of gene counts for each person.
+    `threes` and `nines` hold the same columns times 3 and 9, which
+    index the tables of a person's mother and the person themself.
+
+    Each step maps a builtin over a whole column (one person, every
+    assignment) at once, so the interpreter loops once per person rather
+    than once per person per assignment.
+    """
+    index = {person: i for i, person in enumerate(names)}
+    logs = array.array("d", bytes(8 * len(genes[0])))
+    for i, person in enumerate(names):
+        table = tables[i]
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+        if not mother and not father:
+            rows = genes[i]
+        else:
+            rows = map(add, map(add, nines[i], threes[index[mother]]),
+                       genes[index[father]])
+        logs = array.array("d", map(add, logs, map(table.__getitem__, rows)))
+    return logs
+
+
+def marginals(people, probs, batch_digits=BATCH_DIGITS):
+    """
+    Returns the gene and trait distributions of everyone in `people`, in
+    the form heredity.main prints, from the joint probability of every
+    gene assignment, evaluated 3 ** `batch_digits` assignments at a time.
+
+    Within a batch the first `batch_digits` people run through every
+    gene count in the same pattern, so their columns are built once; the
+    rest have the same gene count throughout a batch.
+
+    Probabilities are kept as logs, and scaled by the largest seen so
+    far before being exponentiated, so large families do not underflow.
+    Unknown traits sum out of the joint probability, and are recovered
+    from the gene distribution at the end.
+    """
+    names = list(people)
+    tables = log_tables(people, names, probs)
+    digits = min(batch_digits, len(names))
+    size = 3 ** digits
+    low = gene_columns(digits, size)
+    low_threes = [scaled(column, 3) for column in low]
+    low_nines = [scaled(column, 9) for column in low]
+    masks = [
+        [bytes(map(eq, column, itertools.repeat(count))) for count in range(3)]
+        for column in low
+    ]
+    totals = [[0, 0, 0] for _ in names]
+    scale = -math.inf
+
+    for batch in range(3 ** (len(names) - digits)):
+        high = [
+            batch // 3 ** i % 3 for i in range(len(names) - digits)
+        ]
+        genes = low + [array.array("b", [count]) * size for count in high]
+        threes = low_threes + [
+            array.array("b", [3 * count]) * size for count in high
+        ]
+        nines = low_nines + [
+            array.array("b", [9 * count]) * size for count in high
+        ]
+        logs = log_joint_probabilities(
+            people, names, tables, genes, threes, nines
+        )
+
+        # Rescale what has been summed so far if this batch has a larger
+        # probability than any before it
+        top = max(logs)
+        if top > scale:
+            factor = math.exp(scale - top)
+            totals = [[total * factor for total in row] for row in totals]
+            scale = top
+        weights = array.array(
+            "d", map(math.exp, map(sub, logs, itertools.repeat(scale)))
+        )
+
+        for i in range(digits):
+            for count in range(3):
+                totals[i][count] += sum(
+                    itertools.compress(weights, masks[i][count])
+                )
+        batch_total = sum(weights)
+        for i, count in enumerate(high, digits):
+            totals[i][count] += batch_total
+
+    probabilities = {}
+    for i, person in enumerate(names):
+        total = sum(totals[i])
+        gene = {count: totals[i][count] / total for count in (2, 1, 0)}
+        trait = people[person]["trait"]
+        if trait is None:
+            have = sum(gene[count] * probs["trait"][count][True]
+                       for count in gene)
+        else:
+            have = 1 if trait else 0
+        probabilities[person] = {
+            "gene": gene,
+            "trait": {True: have, False: 1 - have}
+        }
+    return probabilities
@@ -0,0 +1,223 @@
+import heapq
+import itertools
+
+GENES = (0, 1, 2)
+
+
+class Factor():
+    """
+    A non-negative function of some gene variables: `table` maps each
+    assignment of genes to `variables`, as a tuple in the same order,
+    to a value.
+    """
+
+    def __init__(self, variables, table):
+        self.variables = variables
+        self.table = table
+
+    @classmethod
+    def from_function(cls, variables, function):
+        return cls(variables, {
+            genes: function(*genes)
+            for genes in itertools.product(GENES, repeat=len(variables))
+        })
+
+    def multiply(self, other):
+        variables = self.variables + tuple(
+            v for v in other.variables if v not in self.variables
+        )
+        mine = [variables.index(v) for v in self.variables]
+        theirs = [variables.index(v) for v in other.variables]
+        return Factor.from_function(variables, lambda *genes: (
+            self.table[tuple(genes[i] for i in mine)] *
+            other.table[tuple(genes[i] for i in theirs)]
+        ))
+
+    def divide(self, other):
+        """
+        Divide by a factor over a subset of this factor's variables,
+        taking 0 / 0 to be 0.
+        """
+        theirs = [self.variables.index(v) for v in other.variables]
+        table = {}
+        for genes, value in self.table.items():
+            divisor = other.table[tuple(genes[i] for i in theirs)]
+            table[genes] = value / divisor if divisor else 0
+        return Factor(self.variables, table)
+
+    def marginal(self, variables):
+        """
+        Sum out every variable not in `variables`, and scale the result
+        to sum to 1 so long chains of messages do not underflow.
+        """
+        kept = [self.variables.index(v) for v in variables]
+        table = dict.fromkeys(
+            itertools.product(GENES, repeat=len(variables)), 0
+        )
+        for genes, value in self.table.items():
+            table[tuple(genes[i] for i in kept)] += value
+        total = sum(table.values())
+        if total:
+            table = {genes: value / total for genes, value in table.items()}
+        return Factor(tuple(variables), table)
+
+
+def gene_factors(people, probs):
+    """
+    Returns a factor for each person over their own and their parents'
+    genes: the probability of their gene count given their parents',
+    times the probability of their trait, if it is known, given their
+    gene count.
+    """
+    passes = {
+        0: probs["mutation"],
+        1: 0.5,
+        2: 1 - probs["mutation"]
+    }
+
+    def evidence(person, genes):
+        trait = people[person]["trait"]
+        return 1 if trait is None else probs["trait"][genes][trait]
+
+    factors = []
+    for person in people:
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+        if not mother and not father:
+            def prior(genes, person=person):
+                return probs["gene"][genes] * evidence(person, genes)
+
+            factors.append(Factor.from_function((person,), prior))
+            continue
+
+        def inherit(genes, mother_genes, father_genes, person=person):
+            m, f = passes[mother_genes], passes[father_genes]
+            p = (m * f if genes == 2 else
+                 m * (1 - f) + f * (1 - m) if genes == 1 else
+                 (1 - m) * (1 - f))
+            return p * evidence(person, genes)
+
+        factors.append(Factor.from_function((person, mother, father), inherit))
+    return factors
+
+
+def elimination_order(people):
+    """
+    Returns an order to eliminate everyone's gene variable in, picking
+    each time the person whose elimination adds the fewest new edges to
+    the moral graph (each person joined to their parents, and parents to
+    each other). In a pedigree without loops this always finds someone
+    who adds none, so no clique has more than a person and two parents.
+    """
+    neighbors = {person: set() for person in people}
+    for person in people:
+        family = [person] + [
+            parent for parent in (people[person]["mother"],
+                                  people[person]["father"]) if parent
+        ]
+        for a, b in itertools.combinations(family, 2):
+            neighbors[a].add(b)
+            neighbors[b].add(a)
+
+    def score(person):
+        fill = sum(
+            1 for a, b in itertools.combinations(neighbors[person], 2)
+            if b not in neighbors[a]
+        )
+        return (fill, len(neighbors[person]), person)
+
+    # Only the neighbors of an eliminated person change score, so the
+    # heap holds stale entries that are skipped when they come up
+    scores = {person: score(person) for person in people}
+    heap = list(scores.values())
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        entry = heapq.heappop(heap)
+        person = entry[-1]
+        if scores.get(person) != entry:
+            continue
+        del scores[person]
+
+        for a, b in itertools.combinations(neighbors[person], 2):
+            neighbors[a].add(b)
+            neighbors[b].add(a)
+        for neighbor in neighbors[person]:
+            neighbors[neighbor].discard(person)
+        for neighbor in neighbors[person]:
+            scores[neighbor] = score(neighbor)
+            heapq.heappush(heap, scores[neighbor])
+        order.append((person, tuple(sorted(neighbors[person]))))
+    return order
+
+
+def gene_marginals(people, probs):
+    """
+    Returns each person's distribution over gene counts given the known
+    traits, by sum-product message passing over the clique tree that
+    eliminating gene variables in `elimination_order` builds.
+
+    Eliminating person v creates the clique of v and the neighbors it
+    still has, whose parent is the clique of whichever of those
+    neighbors is eliminated next. Messages are passed up the tree in
+    elimination order and back down in reverse, so the work is linear in
+    the number of people for pedigrees of bounded width.
+    """
+    order = elimination_order(people)
+    position = {person: i for i, (person, _) in enumerate(order)}
+    cliques = [(person,) + rest for person, rest in order]
+    parents = [
+        min((position[v] for v in rest), default=None) for _, rest in order
+    ]
+    separators = [rest for _, rest in order]
+
+    # Each factor goes to the clique of the first person in it to be
+    # eliminated, which holds all of its variables
+    potentials = [Factor.from_function(clique, lambda *genes: 1)
+                  for clique in cliques]
+    for factor in gene_factors(people, probs):
+        i = min(position[v] for v in factor.variables)
+        potentials[i] = potentials[i].multiply(factor)
+
+    # Collect: each clique sends its potential, times what its children
+    # sent it, up to its parent
+    beliefs = potentials[:]
+    upward = [None] * len(order)
+    for i in range(len(order)):
+        if parents[i] is not None:
+            upward[i] = beliefs[i].marginal(separators[i])
+            beliefs[parents[i]] = beliefs[parents[i]].multiply(upward[i])
+
+    # Distribute: each parent sends its belief, less what the child
+    # sent it, back down
+    for i in reversed(range(len(order))):
+        if parents[i] is not None:
+            downward = beliefs[parents[i]].marginal(separators[i])
+            beliefs[i] = beliefs[i].multiply(downward.divide(upward[i]))
+
+    return {
+        person: beliefs[position[person]].marginal((person,)).table
+        for person in people
+    }
+
+
+def marginals(people, probs):
+    """
+    Returns the gene and trait distributions of everyone in `people`,
+    in the form heredity.main prints.
+    """
+    genes = gene_marginals(people, probs)
+    probabilities = {}
+    for person in people:
+        gene = {count: genes[person][(count,)] for count in (2, 1, 0)}
+        trait = people[person]["trait"]
+        if trait is None:
+            have = sum(gene[count] * probs["trait"][count][True]
+                       for count in gene)
+        else:
+            have = 1 if trait else 0
+        probabilities[person] = {
+            "gene": gene,
+            "trait": {True: have, False: 1 - have}
+        }
+    return probabilities
@@ -1,7 +1,12 @@
+import argparse
 import csv
 import itertools
 import sys
 
+import batched
+import elimination
+import sampling
+
 PROBS = {
 
     # Unconditional probabilities for having gene
@@ -36,13 +41,77 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Samples drawn by the sampling methods unless told otherwise
+SAMPLES = 10000
+
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Infer who carries a gene from a family's traits."
+    )
+    parser.add_argument("data", help="CSV file of name, mother, father, trait")
+    parser.add_argument(
+        "--method", choices=[*METHODS, *sampling.SAMPLERS],
+        default="elimination",
+        help="exact inference by message passing over the pedigree "
+             "(elimination), or by summing over every assignment, in "
+             "batches in log space (batched) or one at a time (enumerate); "
+             "or approximate inference by likelihood weighting (likelihood) "
+             "or Gibbs sampling (gibbs)"
+    )
+    parser.add_argument(
+        "-n", "--samples", type=int, default=SAMPLES,
+        help="samples drawn in total by the sampling methods"
+    )
+    parser.add_argument(
+        "--chains", type=int, default=4,
+        help="split the samples over this many independent chains"
+    )
+    parser.add_argument(
+        "--processes", type=int, default=None,
+        help="worker processes for the chains (default: one per core)"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    people = load_data(args.data)
+
+    errors = None
+    if args.method in sampling.SAMPLERS:
+        try:
+            probabilities, errors, report = sampling.sample_probabilities(
+                people, PROBS, args.method, args.samples, args.chains,
+                seed=args.seed, processes=args.processes
+            )
+        except ValueError as error:
+            sys.exit(str(error))
+        if "effective" in report:
+            print("Effective samples per chain:",
+                  ", ".join(f"{count:.1f}" for count in report["effective"]))
+        else:
+            print(f"Standard errors from {report['batches']} batch means")
+    else:
+        probabilities = METHODS[args.method](people)
 
-    # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
-    people = load_data(sys.argv[1])
+    # Print results, with the standard error of sampled probabilities
+    for person in people:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                if errors is None:
+                    print(f"    {value}: {p:.4f}")
+                else:
+                    error = errors[person][field][value]
+                    print(f"    {value}: {p:.4f} ± {error:.4f}")
+
+
+def enumerate_probabilities(people):
+    """
+    Return the gene and trait distributions of everyone in `people` by
+    summing the joint probability of every assignment of genes and
+    traits consistent with the known traits.
+    """
 
     # Keep track of gene and trait probabilities for each person
     probabilities = {
@@ -60,18 +129,10 @@ def main():
         for person in people
     }
 
-    # Loop over all sets of people who might have the trait
+    # Loop over all sets of people who might have the trait, given
+    # the traits that are known
     names = set(people)
-    for have_trait in powerset(names):
-
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
+    for have_trait in trait_sets(people):
 
         # Loop over all sets of people who might have the gene
         for one_gene in powerset(names):
@@ -83,15 +144,26 @@ def main():
 
     # Ensure probabilities sum to 1
     normalize(probabilities)
+    return probabilities
 
-    # Print results
-    for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+
+def batch_probabilities(people):
+    """
+    Return the gene and trait distributions of everyone in `people` by
+    summing the joint probability of every gene assignment, evaluated
+    in large batches in log space.
+    """
+    return batched.marginals(people, PROBS)
+
+
+def eliminate_probabilities(people):
+    """
+    Return the gene and trait distributions of everyone in `people` by
+    message passing over the tree that eliminating each person's gene
+    variable in turn builds, in time linear in the size of the family
+    for pedigrees without loops.
+    """
+    return elimination.marginals(people, PROBS)
 
 
 def load_data(filename):
@@ -118,14 +190,25 @@ def load_data(filename):
 
 def powerset(s):
     """
-    Return a list of all possible subsets of set s.
+    Yield all possible subsets of set s, one at a time, so they are
+    never all held in memory at once.
     """
     s = list(s)
-    return [
-        set(s) for s in itertools.chain.from_iterable(
-            itertools.combinations(s, r) for r in range(len(s) + 1)
-        )
-    ]
+    for subset in itertools.chain.from_iterable(
+            itertools.combinations(s, r) for r in range(len(s) + 1)):
+        yield set(subset)
+
+
+def trait_sets(people):
+    """
+    Yield every set of people who might have the trait without
+    contradicting a known trait: those known to have it, plus each
+    subset of those whose trait is unknown.
+    """
+    known = {person for person in people if people[person]["trait"]}
+    unknown = {person for person in people if people[person]["trait"] is None}
+    for subset in powerset(unknown):
+        yield known | subset
 
 
 def joint_probability(people, one_gene, two_genes, have_trait):
@@ -209,5 +292,12 @@ def normalize(probabilities):
         probabilities[person]["trait"] = {trait: (trait_alpha * trait_prob) for trait, trait_prob in probabilities[person]["trait"].items()}
 
 
+METHODS = {
+    "elimination": eliminate_probabilities,
+    "batched": batch_probabilities,
+    "enumerate": enumerate_probabilities,
+}
+
+
 if __name__ == "__main__":
     main()
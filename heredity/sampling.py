@@ -0,0 +1,398 @@
+import math
+import multiprocessing
+import random
+
+# Gibbs sweeps run before any are counted, so the chain forgets where
+# it started
+BURN_IN = 100
+
+# Each Gibbs chain's sweeps are split into this many batches, whose
+# spread gives the standard error of the estimates
+BATCHES = 20
+
+# Likelihood weighting is refused when its weights leave fewer effective
+# samples than this
+MIN_EFFECTIVE_SAMPLES = 100
+
+# Quantities estimated for each person, in the order samplers keep them
+QUANTITIES = [("gene", 2), ("gene", 1), ("gene", 0), ("trait", True)]
+
+# Pedigree, probabilities and sampler shared by the chains in a worker
+chain_people = None
+chain_probs = None
+chain_sampler = None
+
+
+def inheritance(probs):
+    """
+    Returns table[genes][mother][father], the probability of a child
+    having `genes` copies of the gene given their parents' copies.
+    """
+    passes = [probs["mutation"], 0.5, 1 - probs["mutation"]]
+    table = [[[0] * 3 for _ in range(3)] for _ in range(3)]
+    for mother in range(3):
+        for father in range(3):
+            m, f = passes[mother], passes[father]
+            table[2][mother][father] = m * f
+            table[1][mother][father] = m * (1 - f) + f * (1 - m)
+            table[0][mother][father] = (1 - m) * (1 - f)
+    return table
+
+
+def topological_order(people):
+    """
+    Returns everyone in `people` ordered so parents come before their
+    children.
+    """
+    order = []
+    placed = set()
+
+    def place(person):
+        if person in placed:
+            return
+        for parent in (people[person]["mother"], people[person]["father"]):
+            if parent:
+                place(parent)
+        placed.add(person)
+        order.append(person)
+
+    for person in people:
+        place(person)
+    return order
+
+
+def likelihood_weighting(people, probs, samples, rng):
+    """
+    Returns the weighted sums behind estimates of each person's
+    distribution over gene counts, and of their chance of having the
+    trait, from `samples` draws of everyone's genes forward from their
+    parents'.
+
+    Each draw is weighted by how likely it makes the known traits.
+    Unknown traits are never drawn: the chance of the trait given the
+    drawn genes is averaged instead, which has less variance. Alongside
+    the weighted sum of each quantity f, the sums of w ** 2 * f and
+    w ** 2 * f ** 2 are kept for its standard error, and the sums of the
+    weights and their squares for the effective sample size.
+    """
+    table = inheritance(probs)
+    order = topological_order(people)
+    genes = dict.fromkeys(people, 0)
+    sums = {
+        "weight": 0,
+        "squares": 0,
+        "values": {person: [[0, 0, 0] for _ in QUANTITIES]
+                   for person in people}
+    }
+
+    for _ in range(samples):
+        weight = 1
+        for person in order:
+            mother = people[person]["mother"]
+            father = people[person]["father"]
+            if mother and father:
+                distribution = [
+                    table[count][genes[mother]][genes[father]]
+                    for count in range(3)
+                ]
+            else:
+                distribution = [probs["gene"][count] for count in range(3)]
+            genes[person] = draw(distribution, rng)
+
+            trait = people[person]["trait"]
+            if trait is not None:
+                weight *= probs["trait"][genes[person]][trait]
+
+        square = weight * weight
+        sums["weight"] += weight
+        sums["squares"] += square
+        for person in people:
+            values = (
+                genes[person] == 2, genes[person] == 1, genes[person] == 0,
+                trait_probability(people, probs, person, genes[person])
+            )
+            for row, value in zip(sums["values"][person], values):
+                row[0] += weight * value
+                row[1] += square * value
+                row[2] += square * value * value
+
+    return sums
+
+
+def gibbs(people, probs, samples, rng):
+    """
+    Returns estimates of each person's distribution over gene counts,
+    and of their chance of having the trait, from `samples` sweeps of a
+    Gibbs sampler after BURN_IN sweeps to warm up.
+
+    Each sweep redraws every person's genes given everyone else's, which
+    only depends on their parents, their children and their children's
+    other parents, so pedigrees with loops are handled like any other.
+    Each sweep counts the conditional distribution it drew from rather
+    than the single draw, which has less variance.
+
+    The sweeps are split into up to BATCHES runs of consecutive sweeps,
+    and a list of each run's estimates and length is returned. Nearby
+    sweeps are correlated, but runs far longer than that correlation
+    are nearly independent, so their spread gives a standard error.
+    """
+    table = inheritance(probs)
+    children = {person: [] for person in people}
+    for person in people:
+        for parent in (people[person]["mother"], people[person]["father"]):
+            if parent:
+                children[parent].append(person)
+
+    # Start from a draw of everyone's genes from their parents'
+    genes = dict.fromkeys(people, 0)
+    for person in topological_order(people):
+        distribution = conditional(people, probs, table, {}, genes, person)
+        genes[person] = draw(distribution, rng)
+
+    for _ in range(BURN_IN):
+        for person in people:
+            genes[person] = draw(conditional(
+                people, probs, table, children, genes, person
+            ), rng)
+
+    batches = []
+    count = min(BATCHES, samples)
+    for batch in range(count):
+        sweeps = samples * (batch + 1) // count - samples * batch // count
+        totals = {person: [0, 0, 0] for person in people}
+        traits = dict.fromkeys(people, 0)
+        for _ in range(sweeps):
+            for person in people:
+                distribution = conditional(
+                    people, probs, table, children, genes, person
+                )
+                genes[person] = draw(distribution, rng)
+
+                total = sum(distribution)
+                for genes_count in range(3):
+                    share = distribution[genes_count] / total
+                    totals[person][genes_count] += share
+                    traits[person] += share * trait_probability(
+                        people, probs, person, genes_count
+                    )
+        batches.append((estimates(people, totals, traits, sweeps), sweeps))
+    return batches
+
+
+def conditional(people, probs, table, children, genes, person):
+    """
+    Returns, unnormalized, the probability of each gene count for
+    `person` given everyone else's genes in `genes` and the known
+    traits. People without an entry in `children` are treated as having
+    no children.
+    """
+    mother = people[person]["mother"]
+    father = people[person]["father"]
+    trait = people[person]["trait"]
+    distribution = []
+    for count in range(3):
+        if mother and father:
+            p = table[count][genes[mother]][genes[father]]
+        else:
+            p = probs["gene"][count]
+        if trait is not None:
+            p *= probs["trait"][count][trait]
+        for child in children.get(person, ()):
+            child_mother = people[child]["mother"]
+            child_father = people[child]["father"]
+            p *= table[genes[child]][
+                count if child_mother == person else genes[child_mother]
+            ][
+                count if child_father == person else genes[child_father]
+            ]
+        distribution.append(p)
+    return distribution
+
+
+def draw(distribution, rng):
+    """
+    Returns 0, 1 or 2 with probability in proportion to `distribution`.
+    """
+    target = rng.random() * sum(distribution)
+    for count in range(2):
+        target -= distribution[count]
+        if target < 0:
+            return count
+    return 2
+
+
+def trait_probability(people, probs, person, genes):
+    trait = people[person]["trait"]
+    if trait is None:
+        return probs["trait"][genes][True]
+    return 1 if trait else 0
+
+
+def estimates(people, totals, traits, total):
+    """
+    Returns the gene and trait distributions of everyone in `people`,
+    in the form heredity.main prints, from weighted counts.
+    """
+    return {
+        person: {
+            "gene": {count: totals[person][count] / total
+                     for count in (2, 1, 0)},
+            "trait": {True: traits[person] / total,
+                      False: 1 - traits[person] / total}
+        }
+        for person in people
+    }
+
+
+def sample_probabilities(people, probs, sampler, samples, chains,
+                         seed=None, processes=None):
+    """
+    Return the gene and trait distributions of everyone in `people`
+    estimated by `chains` independent runs of `sampler` (a key of
+    SAMPLERS) that share `samples` samples between them, run across a
+    pool of `processes` worker processes.
+
+    Each chain has its own random number generator seeded from `seed`
+    and its number, so results are reproducible for a given seed.
+    Returns the merged distributions, the standard error of each
+    probability, and a dict reporting how the errors were found: the
+    effective sample size of each likelihood weighting chain, or the
+    number of Gibbs batches.
+
+    Raises ValueError if likelihood weighting collapses onto fewer than
+    MIN_EFFECTIVE_SAMPLES effective samples, when its estimates and
+    errors would both be meaningless.
+    """
+    chains = max(1, min(chains, samples))
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    jobs = [
+        (f"{seed}:{chain}", samples // chains + (chain < samples % chains))
+        for chain in range(chains)
+    ]
+
+    if chains == 1:
+        initChain(people, probs, sampler)
+        runs = [runChain(jobs[0])]
+    else:
+        with multiprocessing.Pool(
+                processes, initializer=initChain,
+                initargs=(people, probs, sampler)) as pool:
+            runs = pool.map(runChain, jobs)
+
+    if sampler == "likelihood":
+        return mergeWeighted(people, runs)
+    return mergeBatches(people, [batch for run in runs for batch in run])
+
+
+def mergeWeighted(people, runs):
+    """
+    Merge the weighted sums of likelihood weighting chains into
+    estimates, with the delta-method standard error of each ratio
+    estimate and the effective sample size (sum of weights squared over
+    sum of squared weights) of each chain.
+    """
+    effective = [
+        run["weight"] ** 2 / run["squares"] if run["squares"] else 0
+        for run in runs
+    ]
+    weight = sum(run["weight"] for run in runs)
+    squares = sum(run["squares"] for run in runs)
+    total_effective = weight ** 2 / squares if squares else 0
+    if total_effective < MIN_EFFECTIVE_SAMPLES:
+        raise ValueError(
+            f"likelihood weighting collapsed to {total_effective:.1f} "
+            f"effective samples (chains: "
+            f"{', '.join(f'{e:.1f}' for e in effective)}); draw more "
+            f"samples, or use --method gibbs if the known traits are too "
+            f"unlikely under forward sampling"
+        )
+
+    values, errors = {}, {}
+    for person in people:
+        values[person], errors[person] = [], []
+        for q in range(len(QUANTITIES)):
+            sums = [sum(run["values"][person][q][k] for run in runs)
+                    for k in range(3)]
+            mean = sums[0] / weight
+            variance = (sums[2] - 2 * mean * sums[1] +
+                        mean * mean * squares) / weight ** 2
+            values[person].append(mean)
+            errors[person].append(math.sqrt(max(variance, 0)))
+    return (distributions(people, values),
+            distributions(people, errors, errors=True),
+            {"effective": effective})
+
+
+def mergeBatches(people, batches):
+    """
+    Merge the batch estimates of Gibbs chains, with the standard error
+    of their mean from the spread of the batches.
+    """
+    sweeps = sum(length for _, length in batches)
+    values, errors = {}, {}
+    for person in people:
+        values[person], errors[person] = [], []
+        for field, value in QUANTITIES:
+            means = [batch[person][field][value] for batch, _ in batches]
+            mean = sum(
+                batch_mean * length
+                for batch_mean, (_, length) in zip(means, batches)
+            ) / sweeps
+            values[person].append(mean)
+            if len(batches) < 2:
+                errors[person].append(math.nan)
+                continue
+            errors[person].append(math.sqrt(
+                sum((batch_mean - mean) ** 2 for batch_mean in means)
+                / (len(batches) - 1) / len(batches)
+            ))
+    return (distributions(people, values),
+            distributions(people, errors, errors=True),
+            {"batches": len(batches)})
+
+
+def distributions(people, values, errors=False):
+    """
+    Returns a list of values per person, in QUANTITIES order, in the
+    form heredity.main prints. The chance of not having the trait is the
+    complement of the chance of having it, and has the same standard
+    error when `errors` is true.
+    """
+    return {
+        person: {
+            "gene": {2: values[person][0], 1: values[person][1],
+                     0: values[person][2]},
+            "trait": {True: values[person][3],
+                      False: (values[person][3] if errors
+                              else 1 - values[person][3])}
+        }
+        for person in people
+    }
+
+
+def initChain(people, probs, sampler):
+    """
+    Keep the pedigree in a worker process, so it is sent to each worker
+    once rather than with every chain.
+    """
+    global chain_people, chain_probs, chain_sampler
+    chain_people = people
+    chain_probs = probs
+    chain_sampler = sampler
+
+
+def runChain(job):
+    """
+    Run one chain of a sample in a worker process.
+    """
+    seed, samples = job
+    return SAMPLERS[chain_sampler](
+        chain_people, chain_probs, samples, random.Random(seed)
+    )
+
+
+SAMPLERS = {
+    "likelihood": likelihood_weighting,
+    "gibbs": gibbs,
+}
@@ -0,0 +1,220 @@
+import argparse
+import array
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from bisect import bisect
+from itertools import accumulate
+
+import pagerank
+from linkgraph import LinkGraph, load_graph, save_graph
+from solvers import SOLVERS
+
+# Tolerance of the Jacobi solution other engines are measured against
+REFERENCE_TOLERANCE = 1e-10
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the PageRank engines on generated web graphs."
+    )
+    parser.add_argument(
+        "--sizes", default="1000,10000,100000",
+        help="comma-separated numbers of pages to generate graphs with"
+    )
+    parser.add_argument(
+        "--model", choices=GENERATORS, default="barabasi-albert",
+        help="how links are generated"
+    )
+    parser.add_argument(
+        "--links", type=int, default=4,
+        help="average number of links on a page"
+    )
+    parser.add_argument(
+        "-n", "--samples", type=int, default=None,
+        help="samples drawn by the sampling engine (default: 10 per page)"
+    )
+    parser.add_argument("--tolerance", type=float, default=pagerank.TOLERANCE)
+    parser.add_argument("--seed", type=int, default=50)
+    parser.add_argument(
+        "--mapped", action="store_true",
+        help="rank each graph memory-mapped from a graph file, as with "
+             "pagerank.py --graph"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true",
+        help="skip the second, traced run of each engine that measures "
+             "peak memory"
+    )
+    args = parser.parse_args()
+
+    for size in [int(size) for size in args.sizes.split(",")]:
+        print(f"\nGenerating a {args.model} graph of {size} pages...")
+        start = time.perf_counter()
+        graph = GENERATORS[args.model](size, args.links, args.seed)
+        print(f"{len(graph.sources)} links generated in "
+              f"{time.perf_counter() - start:.2f} seconds.")
+        if not args.mapped:
+            benchmark_graph(graph, args)
+            continue
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "benchmark.graph")
+            save_graph(graph, filename)
+            benchmark_graph(load_graph(filename), args)
+
+
+def benchmark_graph(graph, args):
+    """
+    Print wall time, peak memory, iterations and L1 error against a
+    tightly converged reference for each engine ranking `graph`.
+    """
+    reference, _ = SOLVERS["jacobi"](
+        graph, pagerank.DAMPING, REFERENCE_TOLERANCE
+    )
+    samples = args.samples or 10 * len(graph)
+    engines = engines_for(graph, samples, args.tolerance, args.seed)
+
+    print(f"{'engine':<15}{'seconds':>10}{'peak KiB':>12}"
+          f"{'iterations':>12}{'L1 error':>12}")
+    for name, engine in engines.items():
+        start = time.perf_counter()
+        ranks, iterations = engine()
+        elapsed = time.perf_counter() - start
+
+        peak = ""
+        if not args.no_memory:
+            tracemalloc.start()
+            engine()
+            peak = f"{tracemalloc.get_traced_memory()[1] // 1024}"
+            tracemalloc.stop()
+
+        error = sum(abs(rank - exact) for rank, exact in zip(ranks, reference))
+        print(f"{name:<15}{elapsed:>10.3f}{peak:>12}"
+              f"{iterations!s:>12}{error:>12.2e}")
+
+
+def engines_for(graph, samples, tolerance, seed):
+    """
+    Returns a dict of engines to benchmark on `graph`. Each engine takes
+    no arguments and returns the ranks as a list in page order, along
+    with how many iterations (samples, for sampling; pushes, for the
+    incremental engine) it took. iterate_pagerank does not report its
+    iterations; it runs the jacobi solver.
+    """
+    damping = pagerank.DAMPING
+
+    def ordered(ranks):
+        return [ranks[page] for page in graph.pages]
+
+    def sample():
+        ranks = pagerank.sample_pagerank(
+            graph, damping, samples, random.Random(seed)
+        )
+        return ordered(ranks), samples
+
+    def iterate():
+        ranks = pagerank.iterate_pagerank(graph, damping, tolerance=tolerance)
+        return ordered(ranks), "-"
+
+    def incremental():
+        ranks, pushes = pagerank.incremental_pagerank(
+            graph, damping, {}, tolerance
+        )
+        return ordered(ranks), pushes
+
+    engines = {"sample": sample, "iterate": iterate}
+    for name, solver in SOLVERS.items():
+        engines[name] = lambda solver=solver: solver(graph, damping, tolerance)
+    engines["incremental"] = incremental
+    return engines
+
+
+def barabasi_albert(size, links, seed):
+    """
+    Returns a LinkGraph of `size` pages added one at a time, each linking
+    to `links` distinct earlier pages chosen in proportion to how many
+    links they already have (plus one), so a few early pages become hubs.
+    """
+    rng = random.Random(seed)
+    out_offsets = array.array("q", [0])
+    targets = array.array("i")
+
+    # Each page appears once, plus once for every link to it, so a
+    # uniform draw from `endpoints` is a preferential one
+    endpoints = array.array("i")
+    for page in range(size):
+        chosen = set()
+        while len(chosen) < min(links, page):
+            chosen.add(endpoints[int(rng.random() * len(endpoints))])
+        targets.extend(sorted(chosen))
+        out_offsets.append(len(targets))
+        endpoints.extend(chosen)
+        endpoints.append(page)
+
+    return graphFromLinks(size, out_offsets, targets)
+
+
+def power_law(size, links, seed, exponent=2.1):
+    """
+    Returns a LinkGraph of `size` pages whose numbers of links, and
+    numbers of links to them, both follow a power law with `exponent`
+    and average about `links` (Chung-Lu). Unlike barabasi_albert, links
+    go to earlier and later pages alike, so the graph has cycles.
+    """
+    rng = random.Random(seed)
+    shape = exponent - 1
+    weights = [rng.paretovariate(shape) for _ in range(size)]
+    scale = links * size / sum(weights)
+    cumulative = list(accumulate(rng.paretovariate(shape) for _ in range(size)))
+    total = cumulative[-1]
+
+    out_offsets = array.array("q", [0])
+    targets = array.array("i")
+    for page in range(size):
+        degree = min(size - 1, int(weights[page] * scale + rng.random()))
+        chosen = set()
+        while len(chosen) < degree:
+            target = bisect(cumulative, rng.random() * total)
+            if target != page:
+                chosen.add(target)
+        targets.extend(sorted(chosen))
+        out_offsets.append(len(targets))
+
+    return graphFromLinks(size, out_offsets, targets)
+
+
+def graphFromLinks(size, out_offsets, targets):
+    """
+    Build a LinkGraph from out-link CSR arrays, counting links into each
+    page to lay out the in-link arrays without a corpus dict.
+    """
+    offsets = array.array("q", [0]) * (size + 1)
+    for target in targets:
+        offsets[target + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+
+    sources = array.array("i", [0]) * len(targets)
+    position = array.array("q", offsets[:size])
+    for j in range(size):
+        for target in targets[out_offsets[j]:out_offsets[j + 1]]:
+            sources[position[target]] = j
+            position[target] += 1
+
+    # Zero-padded, so sorted names keep the pages in generated order
+    width = len(str(size))
+    pages = [f"{page:0{width}}.html" for page in range(size)]
+    return LinkGraph(pages, offsets, sources, out_offsets, targets)
+
+
+GENERATORS = {
+    "barabasi-albert": barabasi_albert,
+    "power-law": power_law,
+}
+
+
+if __name__ == "__main__":
+    main()
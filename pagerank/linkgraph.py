@@ -0,0 +1,203 @@
+import array
+import mmap
+import os
+import struct
+import sys
+
+GRAPH_MAGIC = b"LINKGRPH"
+GRAPH_VERSION = 1
+
+
+class PageNames():
+    """
+    A read-only sequence of page names packed into a single UTF-8
+    buffer, with `offsets[i]:offsets[i + 1]` marking where name i lives.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_names(cls, names):
+        data = bytearray()
+        offsets = array.array("q", [0])
+        for name in names:
+            data += name.encode("utf-8")
+            offsets.append(len(data))
+        return cls(bytes(data), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class LinkGraph():
+    """
+    A corpus with its pages numbered 0 to N - 1 in sorted order, and its
+    links stored as CSR matrices of incoming and outgoing links:
+
+    sources[offsets[i]:offsets[i + 1]] are the pages that link to page i,
+    targets[out_offsets[j]:out_offsets[j + 1]] are the pages page j links
+    to, and out_degree[j] is the number of links on page j. Pages with no
+    links ("dangling" pages) are treated as linking to every page.
+
+    A graph read by `load_graph` keeps its arrays in the memory-mapped
+    file, and remembers the file's name so worker processes map the
+    same file rather than being sent a copy.
+    """
+
+    def __init__(self, pages, offsets, sources, out_offsets, targets,
+                 filename=None):
+        self.pages = pages
+        self.offsets = offsets
+        self.sources = sources
+        self.out_offsets = out_offsets
+        self.targets = targets
+        self.filename = filename
+        self.out_degree = array.array(
+            "i", (out_offsets[j + 1] - out_offsets[j] for j in range(len(pages)))
+        )
+        self.dangling = array.array(
+            "i", (j for j, degree in enumerate(self.out_degree) if degree == 0)
+        )
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        Build a LinkGraph from a corpus dict as returned by `crawl`.
+        """
+        pages = sorted(corpus)
+        index = {page: i for i, page in enumerate(pages)}
+
+        incoming = [[] for _ in pages]
+        out_offsets = array.array("q", [0])
+        targets = array.array("i")
+        for j, page in enumerate(pages):
+            links = sorted(index[link] for link in corpus[page])
+            targets.extend(links)
+            out_offsets.append(len(targets))
+            for link in links:
+                incoming[link].append(j)
+
+        offsets = array.array("q", [0])
+        sources = array.array("i")
+        for links in incoming:
+            sources.extend(links)
+            offsets.append(len(sources))
+
+        return cls(pages, offsets, sources, out_offsets, targets)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __reduce__(self):
+        if self.filename is None:
+            return (LinkGraph, (self.pages, self.offsets, self.sources,
+                                self.out_offsets, self.targets))
+        return (load_graph, (self.filename,))
+
+    def outgoing(self, j):
+        return self.targets[self.out_offsets[j]:self.out_offsets[j + 1]]
+
+    def to_dict(self, ranks):
+        """
+        Returns a dict mapping each page name to its value in `ranks`.
+        """
+        return {page: ranks[i] for i, page in enumerate(self.pages)}
+
+
+def save_graph(graph, filename, key=()):
+    """
+    Write `graph` to `filename` in a form `load_graph` can memory-map,
+    tagged with `key` (a sequence of integers describing its source).
+    """
+    pages = PageNames.from_names(graph.pages)
+    write_sections(filename, list(key), [
+        pages.data, pages.offsets, graph.offsets, graph.sources,
+        graph.out_offsets, graph.targets
+    ])
+
+
+def load_graph(filename, key=None):
+    """
+    Memory-map a LinkGraph written by `save_graph`. Returns None if the
+    file is missing or unreadable, or if `key` is given and the file was
+    saved with a different one.
+    """
+    sections = read_sections(filename, key)
+    if sections is None:
+        return None
+    data, names, offsets, sources, out_offsets, targets = sections
+    return LinkGraph(
+        PageNames(data, names.cast("q")), offsets.cast("q"),
+        sources.cast("i"), out_offsets.cast("q"), targets.cast("i"),
+        filename=filename
+    )
+
+
+def write_sections(filename, key, sections):
+    """
+    Write a header of the magic number, version, byte order and `key`,
+    followed by each buffer in `sections` aligned to 8 bytes.
+    """
+    header = struct.pack(
+        f"=8sI?I{len(key)}q", GRAPH_MAGIC, GRAPH_VERSION,
+        sys.byteorder == "little", len(key), *key
+    )
+
+    # Write to a temporary file first so a partly written file is
+    # never picked up by another process
+    temporary = f"{filename}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(header)
+        f.write(struct.pack("=I", len(sections)))
+        for section in sections:
+            data = memoryview(section).cast("B")
+            f.write(bytes(-f.tell() % 8))
+            f.write(struct.pack("=q", len(data)))
+            f.write(data)
+    os.replace(temporary, filename)
+
+
+def read_sections(filename, key=None):
+    """
+    Memory-map a file written by `write_sections` and return its
+    sections as byte memoryviews, or None if it is missing, its header
+    does not match, or it was written with a key other than `key`.
+    """
+    try:
+        with open(filename, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    header = struct.Struct("=8sI?I")
+    if len(mapped) < header.size:
+        return None
+    magic, version, little, length = header.unpack_from(mapped)
+    if (magic != GRAPH_MAGIC or version != GRAPH_VERSION or
+            little != (sys.byteorder == "little")):
+        return None
+    position = header.size
+    stored_key = list(struct.unpack_from(f"={length}q", mapped, position))
+    position += 8 * length
+    if key is not None and stored_key != list(key):
+        return None
+
+    view = memoryview(mapped)
+    (count,) = struct.unpack_from("=I", mapped, position)
+    position += 4
+    sections = []
+    for _ in range(count):
+        position += -position % 8
+        (size,) = struct.unpack_from("=q", mapped, position)
+        position += 8
+        sections.append(view[position:position + size])
+        position += size
+    return sections
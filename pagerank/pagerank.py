@@ -1,72 +1,328 @@
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
 import os
 import random
 import re
-import sys
+import time
+from collections import deque
+
+from linkgraph import LinkGraph, load_graph, save_graph
+from solvers import SOLVERS, link_weights, personalized
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Total change in the ranks over one iteration at which iteration stops
+TOLERANCE = 0.001
+
+LINK_PATTERN = re.compile(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
+
+# Characters read from a page at a time while extracting its links
+BLOCK_SIZE = 65536
+
+# Characters kept from the end of a block in case they start a link cut
+# off by the block's end; links in longer tags split across blocks are
+# missed, but a stray "<" cannot make the carried text grow without end
+MAX_TAG_LENGTH = 4096
+
+# Crawl manifest kept in the corpus directory by --incremental
+MANIFEST_FILE = ".pagerank-manifest.json"
+
+# Personalization vectors iterated together in one pass over the links
+VECTOR_BLOCK = 64
+
+# z-score of a two-sided 95% confidence interval
+Z_95 = 1.96
+
+# Student-t quantiles of a two-sided 95% confidence interval, indexed by
+# degrees of freedom (T_95[0] is unused)
+T_95 = (
+    math.inf, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306,
+    2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101,
+    2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048,
+    2.045, 2.042
+)
+
+# Corpus and damping factor shared by the walkers in a worker process
+walker_corpus = None
+walker_damping = None
+
 
 def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python pagerank.py corpus")
-    corpus = crawl(sys.argv[1])
-    ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
-    print(f"PageRank Results from Sampling (n = {SAMPLES})")
-    for page in sorted(ranks):
-        print(f"  {page}: {ranks[page]:.4f}")
-    ranks = iterate_pagerank(corpus, DAMPING)
-    print(f"PageRank Results from Iteration")
+    parser = argparse.ArgumentParser(description="Rank the pages of a corpus.")
+    parser.add_argument("corpus")
+    parser.add_argument("-n", "--samples", type=int, default=SAMPLES)
+    parser.add_argument(
+        "--walkers", type=int, default=1,
+        help="split the samples over this many independent random walks"
+    )
+    parser.add_argument(
+        "--processes", type=int, default=None,
+        help="worker processes for the crawl and the walkers "
+             "(default: one per core for the walkers, one for the crawl)"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="only re-parse pages changed since the last crawl"
+    )
+    parser.add_argument(
+        "--graph", metavar="FILE",
+        help="keep the crawled link graph in FILE and memory-map it from "
+             "there while it is up to date with the corpus"
+    )
+    parser.add_argument(
+        "--ranks", metavar="FILE",
+        help="start iteration from the ranks saved in FILE, and save the "
+             "new ranks there"
+    )
+    parser.add_argument(
+        "--solver", choices=SOLVERS, default=None,
+        help="iterative method used to compute the ranks (default: jacobi); "
+             "cannot be combined with --ranks, which always pushes "
+             "residuals from the saved ranks"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=TOLERANCE,
+        help="stop iterating once the ranks change by less than this in total"
+    )
+    parser.add_argument(
+        "--personalize", metavar="FILE",
+        help="also rank pages for each personalization in FILE, a JSON "
+             "object mapping a name to the weights it gives pages"
+    )
+    parser.add_argument(
+        "--compare-solvers", action="store_true",
+        help="report iterations and time taken by every solver"
+    )
+    args = parser.parse_args()
+    if args.ranks and args.solver:
+        parser.error("--solver cannot be used with --ranks")
+
+    manifest = None
+    if args.incremental:
+        manifest = os.path.join(args.corpus, MANIFEST_FILE)
+    if args.graph:
+        corpus = load_corpus(
+            args.corpus, args.graph, args.processes or 1, manifest
+        )
+    else:
+        corpus = crawl(
+            args.corpus, processes=args.processes or 1, manifest=manifest
+        )
+    if args.walkers > 1:
+        ranks, errors = parallel_sample_pagerank(
+            corpus, DAMPING, args.samples, args.walkers,
+            seed=args.seed, processes=args.processes
+        )
+        print(f"PageRank Results from Sampling (n = {args.samples}, "
+              f"{min(args.walkers, args.samples)} walkers, 95% confidence)")
+        for page in sorted(ranks):
+            if errors is None:
+                print(f"  {page}: {ranks[page]:.4f}")
+            else:
+                print(f"  {page}: {ranks[page]:.4f} ± {errors[page]:.4f}")
+    else:
+        rng = random.Random(args.seed)
+        ranks = sample_pagerank(corpus, DAMPING, args.samples, rng)
+        print(f"PageRank Results from Sampling (n = {args.samples})")
+        for page in sorted(ranks):
+            print(f"  {page}: {ranks[page]:.4f}")
+    if args.ranks:
+        ranks, pushes = incremental_pagerank(
+            corpus, DAMPING, load_ranks(args.ranks), args.tolerance
+        )
+        save_ranks(args.ranks, ranks)
+        print(f"PageRank Results from Iteration ({pushes} pushes)")
+    else:
+        ranks = iterate_pagerank(
+            corpus, DAMPING, args.solver or "jacobi", args.tolerance
+        )
+        print(f"PageRank Results from Iteration")
     for page in sorted(ranks):
         print(f"  {page}: {ranks[page]:.4f}")
 
+    if args.personalize:
+        with open(args.personalize) as f:
+            personalizations = json.load(f)
+        results = personalized_pagerank(
+            corpus, DAMPING, list(personalizations.values()), args.tolerance
+        )
+        for name, ranks in zip(personalizations, results):
+            print(f"Personalized PageRank Results for {name}")
+            for page in sorted(ranks):
+                print(f"  {page}: {ranks[page]:.4f}")
+
+    if args.compare_solvers:
+        compare_solvers(corpus, DAMPING, args.tolerance)
 
-def crawl(directory):
+
+def crawl(directory, processes=1, manifest=None):
     """
     Parse a directory of HTML pages and check for links to other pages.
     Return a dictionary where each key is a page, and values are
     a list of all other pages in the corpus that are linked to by the page.
+
+    Pages are parsed by a pool of `processes` worker processes (one per
+    core if None). If `manifest` names a file, the size, modification
+    time and links of every page are saved there, and on later crawls
+    only pages that are new or have changed since are parsed again.
     """
-    pages = dict()
+    previous = loadManifest(manifest) if manifest else {}
 
-    # Extract all links from HTML files
-    for filename in os.listdir(directory):
+    # Reuse the links of pages that have not changed since the last crawl
+    entries = {}
+    stale = []
+    for filename in sorted(os.listdir(directory)):
         if not filename.endswith(".html"):
             continue
-        with open(os.path.join(directory, filename)) as f:
-            contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
+        stat = os.stat(os.path.join(directory, filename))
+        entry = previous.get(filename)
+        if (entry is not None and entry["size"] == stat.st_size and
+                entry["mtime_ns"] == stat.st_mtime_ns):
+            entries[filename] = entry
+        else:
+            entries[filename] = {
+                "size": stat.st_size, "mtime_ns": stat.st_mtime_ns
+            }
+            stale.append(filename)
+
+    # Extract all links from new and changed HTML files
+    paths = [os.path.join(directory, filename) for filename in stale]
+    if processes == 1 or len(paths) < 2:
+        parsed = map(parse_links, paths)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            parsed = pool.map(parse_links, paths, chunksize=16)
+    for filename, links in zip(stale, parsed):
+        entries[filename]["links"] = sorted(links)
+
+    if manifest:
+        saveManifest(manifest, entries)
 
     # Only include links to other pages in the corpus
-    for filename in pages:
+    pages = dict()
+    for filename, entry in entries.items():
         pages[filename] = set(
-            link for link in pages[filename]
-            if link in pages
+            link for link in entry["links"]
+            if link in entries and link != filename
         )
 
     return pages
 
 
+def load_corpus(directory, filename, processes=1, manifest=None):
+    """
+    Return the LinkGraph of a directory of HTML pages, memory-mapped from
+    `filename`. If the file is missing or the directory has changed since
+    it was written, crawl the directory and write it again first.
+    """
+    key = corpus_key(directory)
+    graph = load_graph(filename, key)
+    if graph is None:
+        corpus = crawl(directory, processes=processes, manifest=manifest)
+        save_graph(LinkGraph.from_corpus(corpus), filename, key)
+        graph = load_graph(filename, key)
+    return graph
+
+
+def corpus_key(directory):
+    """
+    Returns the number of HTML pages in `directory`, their total size,
+    their latest modification time and a hash of their sorted names,
+    which a saved link graph must match to be used. Renaming a page
+    changes none of the first three, but changes the hash.
+    """
+    count = size = latest = 0
+    names = hashlib.sha256()
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".html"):
+            stat = os.stat(os.path.join(directory, filename))
+            count += 1
+            size += stat.st_size
+            latest = max(latest, stat.st_mtime_ns)
+            names.update(filename.encode() + b"\0")
+    digest = int.from_bytes(names.digest()[:8], "little", signed=True)
+    return [count, size, latest, digest]
+
+
+def asGraph(corpus):
+    """
+    Return `corpus` as a LinkGraph, whether it is a corpus dict as
+    returned by `crawl` or already a LinkGraph.
+    """
+    if isinstance(corpus, LinkGraph):
+        return corpus
+    return LinkGraph.from_corpus(corpus)
+
+
+def parse_links(path):
+    """
+    Return the set of links in the HTML file at `path`, reading it a
+    block at a time so large pages are never held in memory whole.
+    """
+    links = set()
+    carry = ""
+    with open(path) as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), ""):
+            text = carry + block
+            end = 0
+            for match in LINK_PATTERN.finditer(text):
+                links.add(match.group(1))
+                end = match.end()
+
+            # Keep a tag cut off by the end of the block for the next one
+            start = text.rfind("<", max(end, len(text) - MAX_TAG_LENGTH))
+            carry = text[start:] if start != -1 else ""
+    return links
+
+
+def loadManifest(filename):
+    """
+    Return the pages recorded in a crawl manifest, or an empty dict if
+    there is no usable manifest.
+    """
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveManifest(filename, entries):
+    temporary = f"{filename}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(entries, f)
+    os.replace(temporary, filename)
+
+
 def transition_model(corpus, page, damping_factor):
+    """
+    Return a probability distribution over which page to visit next,
+    given a current page.
 
-    pages = corpus[page]
+    With probability `damping_factor`, choose a link at random
+    linked to by `page`. With probability `1 - damping_factor`, choose
+    a link at random chosen from all pages in the corpus.
+    """
+    links = corpus[page]
 
     # If there are no links on the target page, the surfer is likely to end up anywhere in the corpus with equal probability
-    if not pages:
+    if not links:
         probability = 1 / len(corpus)
-        return {page: probability for page in corpus}
-
-    uniform_probability = (1 - damping_factor) / len(corpus)
-    initial_probability = (1 / len(pages))
+        return {p: probability for p in corpus}
 
-    probabilities = {p: (initial_probability * damping_factor) for p in pages}
-    probabilities[page] = 0
+    probabilities = {p: (1 - damping_factor) / len(corpus) for p in corpus}
+    for link in links:
+        probabilities[link] += damping_factor / len(links)
 
-    return {p: probabilities[p] + uniform_probability for p in probabilities}
+    return probabilities
 
 
-def sample_pagerank(corpus, damping_factor, n):
+def sample_pagerank(corpus, damping_factor, n, rng=random):
     """
     Return PageRank values for each page by sampling `n` pages
     according to transition model, starting with a page at random.
@@ -74,23 +330,117 @@ def sample_pagerank(corpus, damping_factor, n):
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
+
+    Rather than building the transition model on every step, each step
+    is drawn in two stages from the link graph: follow a link with
+    probability `damping_factor` (if the page has any), otherwise jump
+    to any page. Both stages are a single O(1) draw.
+    """
+    # Pages are numbered in sorted order, so a seeded rng gives the same
+    # walk in every process
+    graph = asGraph(corpus)
+    n_pages = len(graph)
+    out_offsets, out_degree, targets = (
+        graph.out_offsets, graph.out_degree, graph.targets
+    )
+    visits = [0] * n_pages
+    random_number = rng.random
+
+    page = int(random_number() * n_pages)
+    for _ in range(n):
+        visits[page] += 1
+        degree = out_degree[page]
+        if degree and random_number() < damping_factor:
+            page = targets[out_offsets[page] + int(random_number() * degree)]
+        else:
+            page = int(random_number() * n_pages)
+
+    return graph.to_dict([count / n for count in visits])
+
+
+def parallel_sample_pagerank(corpus, damping_factor, n, walkers,
+                             seed=None, processes=None):
+    """
+    Return PageRank values estimated by `walkers` independent random
+    walks that share `n` samples between them, run across a pool of
+    `processes` worker processes.
+
+    Each walk has its own random number generator seeded from `seed` and
+    its number, so results are reproducible for a given seed. Returns
+    the merged ranks, and for each page the half-width of a 95%
+    confidence interval (Student-t, as there are only a few walks) from
+    the spread of the walks' own estimates. There are no intervals (None)
+    if there is only one walk.
+
+    `walkers` is cut down to `n` if there are fewer samples than walks.
+    """
+    graph = asGraph(corpus)
+    walkers = max(1, min(walkers, n))
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    jobs = [
+        (f"{seed}:{walker}", n // walkers + (walker < n % walkers))
+        for walker in range(walkers)
+    ]
+
+    with multiprocessing.Pool(
+            processes, initializer=initWalker,
+            initargs=(graph, damping_factor)) as pool:
+        estimates = pool.map(walk, jobs)
+
+    ranks = {
+        page: sum(estimate[page] * samples
+                  for estimate, (_, samples) in zip(estimates, jobs)) / n
+        for page in graph.pages
+    }
+    if walkers == 1:
+        return ranks, None
+    errors = {
+        page: t_quantile(walkers - 1) * math.sqrt(
+            sum((estimate[page] - ranks[page]) ** 2 for estimate in estimates)
+            / (walkers - 1) / walkers
+        )
+        for page in graph.pages
+    }
+    return ranks, errors
+
+
+def t_quantile(freedom):
+    """
+    Returns the two-sided 95% quantile of Student's t distribution with
+    `freedom` degrees of freedom, from T_95 or, past its end, from the
+    Cornish-Fisher expansion around Z_95.
+    """
+    if freedom < len(T_95):
+        return T_95[freedom]
+    z = Z_95
+    return (z + (z ** 3 + z) / (4 * freedom) +
+            (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * freedom ** 2))
+
+
+def initWalker(corpus, damping_factor):
     """
-    page_rank = {name: 0 for name in corpus}
-    page = random.choice(list(corpus.keys()))
+    Keep the corpus in a worker process, so it is sent to each worker
+    once rather than with every walk. A memory-mapped LinkGraph is sent
+    as its file name, and each worker maps the file itself.
+    """
+    global walker_corpus, walker_damping
+    walker_corpus = corpus
+    walker_damping = damping_factor
 
-    while n > 0:
-        page_rank[page] += 1
-        dist = transition_model(corpus, page, damping_factor)
-        keys = list(dist.keys())
-        values = list(dist.values())
-        page = random.choices(keys, weights=values, k=1)[0]
-        n -= 1
 
-    page_rank_sum = sum(page_rank.values())
-    return {p: page_rank[p] / page_rank_sum for p in page_rank}
+def walk(job):
+    """
+    Run one random walk of a parallel sample in a worker process.
+    """
+    seed, samples = job
+    return sample_pagerank(
+        walker_corpus, walker_damping, samples, random.Random(seed)
+    )
 
 
-def iterate_pagerank(corpus, damping_factor):
+def iterate_pagerank(corpus, damping_factor, solver="jacobi",
+                     tolerance=TOLERANCE):
     """
     Return PageRank values for each page by iteratively updating
     PageRank values until convergence.
@@ -98,40 +448,151 @@ def iterate_pagerank(corpus, damping_factor):
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
-    """
-
-    old_page_ranks = {p: 0 for p in corpus}
-    new_page_ranks = {p: 1 / len(list(corpus.keys())) for p in corpus}
-    threshold = 0.001
 
-    while not within_threshold(new_page_ranks, old_page_ranks, threshold):
-        old_page_ranks = new_page_ranks.copy()
-        dampen_term = (1 - damping_factor) / len(corpus)
-
-        for page in new_page_ranks:
-            iterative_term = 0
-
-            for i in corpus:
-                if page in corpus[i]:
-                    iterative_term += (old_page_ranks[i] /
-                                       num_links(corpus, i))
+    `solver` names one of solvers.SOLVERS, which iterates until the
+    ranks change by less than `tolerance` in total.
+    """
+    graph = asGraph(corpus)
+    ranks, _ = SOLVERS[solver](graph, damping_factor, tolerance)
+    return graph.to_dict(ranks)
 
-            rank = dampen_term + (damping_factor * iterative_term)
-            new_page_ranks[page] = rank
 
-    return new_page_ranks
+def compare_solvers(corpus, damping_factor, tolerance=TOLERANCE):
+    """
+    Print how many iterations and how long each solver takes on `corpus`.
+    """
+    graph = asGraph(corpus)
+    print(f"{'solver':<15}{'iterations':>12}{'seconds':>10}")
+    for name, solver in SOLVERS.items():
+        start = time.perf_counter()
+        _, iterations = solver(graph, damping_factor, tolerance)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<15}{iterations:>12}{elapsed:>10.4f}")
 
 
-def num_links(corpus, i):
-    links = len(corpus[i])
-    if links:
-        return links
-    return len(list(corpus.keys()))
+def personalized_pagerank(corpus, damping_factor, personalizations,
+                          tolerance=TOLERANCE):
+    """
+    Return personalized PageRank values for each of `personalizations`,
+    a list of dicts mapping pages to how much weight the random surfer
+    gives them when jumping (pages left out get none). Weights need not
+    sum to 1.
+
+    Return a list with a dictionary of PageRank values for each
+    personalization, in the same order. The vectors are iterated
+    VECTOR_BLOCK at a time, sharing one pass over the links per
+    iteration.
+    """
+    graph = asGraph(corpus)
+    teleports = []
+    for weights in personalizations:
+        row = [weights.get(page, 0) for page in graph.pages]
+        total = sum(row)
+        if total <= 0:
+            raise ValueError("personalization gives no weight to any page")
+        teleports.append([weight / total for weight in row])
+
+    results = []
+    for start in range(0, len(teleports), VECTOR_BLOCK):
+        block, _ = personalized(
+            graph, damping_factor, teleports[start:start + VECTOR_BLOCK],
+            tolerance
+        )
+        results.extend(graph.to_dict(ranks) for ranks in block)
+    return results
 
 
-# Tests if every value of the new ranks are within the 0.001 threshold of the old ranks
-def within_threshold(old_ranks, new_ranks, threshold):
-    return all(abs(old_ranks[p] - new_ranks[i]) < threshold for p, i in zip(old_ranks, new_ranks))
+def incremental_pagerank(corpus, damping_factor, previous,
+                         tolerance=TOLERANCE):
+    """
+    Return PageRank values for the pages of `corpus`, starting from the
+    ranks in `previous` (for example, saved from a run before the corpus
+    changed) rather than from uniform ranks.
+
+    The residual of the warm start is computed with one pass over the
+    links, and is then pushed along links only from pages whose residual
+    is still above `tolerance / N`, so work is concentrated around the
+    links that actually changed (Gauss-Southwell). Returns the ranks and
+    the number of pushes made.
+    """
+    graph = asGraph(corpus)
+    n = len(graph)
+    limit = tolerance / n
+    ranks = [previous.get(page, 0) for page in graph.pages]
+
+    # residual[i] + spread is how far page i is from satisfying the
+    # PageRank equation; spread is what dangling pages have pushed to
+    # every page, kept apart so such a push costs O(1)
+    dangling = sum(ranks[j] for j in graph.dangling) / n
+    base = (1 - damping_factor) / n + damping_factor * dangling
+    weights = link_weights(graph)
+    residual = [
+        base - ranks[i] + damping_factor * sum(
+            ranks[j] * weights[j]
+            for j in graph.sources[graph.offsets[i]:graph.offsets[i + 1]]
+        )
+        for i in range(n)
+    ]
+    spread = 0
+    pushes = 0
+
+    queue = deque(i for i in range(n) if abs(residual[i]) > limit)
+    queued = [False] * n
+    for i in queue:
+        queued[i] = True
+
+    while queue:
+        while queue:
+            page = queue.popleft()
+            queued[page] = False
+            push = residual[page] + spread
+            if abs(push) <= limit:
+                continue
+
+            ranks[page] += push
+            residual[page] = -spread
+            pushes += 1
+
+            if weights[page]:
+                share = damping_factor * push * weights[page]
+                for link in graph.outgoing(page):
+                    residual[link] += share
+                    if not queued[link] and abs(residual[link] + spread) > limit:
+                        queue.append(link)
+                        queued[link] = True
+            else:
+                spread += damping_factor * push / n
+
+        # Fold what dangling pages spread into every residual, and pick
+        # up any page it pushed over the limit
+        for i in range(n):
+            residual[i] += spread
+            if abs(residual[i]) > limit:
+                queue.append(i)
+                queued[i] = True
+        spread = 0
+
+    total = sum(ranks)
+    return graph.to_dict([rank / total for rank in ranks]), pushes
+
+
+def load_ranks(filename):
+    """
+    Return the ranks saved in `filename`, or an empty dict if there are
+    none.
+    """
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_ranks(filename, ranks):
+    temporary = f"{filename}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(ranks, f)
+    os.replace(temporary, filename)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,255 @@
+from operator import add
+
+# Iterations of plain power iteration between quadratic extrapolations
+EXTRAPOLATION_PERIOD = 5
+
+# Iterations a page's rank must stay within its share of the tolerance
+# before the adaptive solver stops recomputing it
+FREEZE_AFTER = 2
+
+
+def link_weights(graph):
+    """
+    Returns the share of its rank each page passes along each link.
+    """
+    return [1 / degree if degree else 0 for degree in graph.out_degree]
+
+
+def jacobi_step(graph, ranks, weights, damping_factor):
+    """
+    Returns the ranks after one multiplication by the transition matrix.
+    Dangling pages spread their rank evenly over the whole corpus.
+    """
+    n = len(graph)
+    offsets, sources = graph.offsets, graph.sources
+    shares = [rank * weight for rank, weight in zip(ranks, weights)]
+    dangling = sum(ranks[j] for j in graph.dangling) / n
+    base = (1 - damping_factor) / n + damping_factor * dangling
+    return [
+        base + damping_factor * sum(
+            map(shares.__getitem__, sources[offsets[i]:offsets[i + 1]])
+        )
+        for i in range(n)
+    ]
+
+
+def l1_change(new_ranks, ranks):
+    return sum(abs(new - old) for new, old in zip(new_ranks, ranks))
+
+
+def normalized(ranks):
+    total = sum(ranks)
+    return [rank / total for rank in ranks]
+
+
+def jacobi(graph, damping_factor, tolerance):
+    """
+    Plain power iteration: every rank is recomputed from the previous
+    iteration's ranks.
+    """
+    n = len(graph)
+    weights = link_weights(graph)
+    ranks = [1 / n] * n
+    iterations = 0
+
+    while True:
+        new_ranks = jacobi_step(graph, ranks, weights, damping_factor)
+        iterations += 1
+        if l1_change(new_ranks, ranks) < tolerance:
+            return new_ranks, iterations
+        ranks = new_ranks
+
+
+def gauss_seidel(graph, damping_factor, tolerance):
+    """
+    Ranks are updated in place, so each page already sees the new ranks
+    of the pages before it in the same sweep. The ranks are scaled back
+    to sum to 1 after every sweep; otherwise the total only converges
+    by a factor of the damping factor per sweep, however fast the
+    shape of the ranks does.
+    """
+    n = len(graph)
+    offsets, sources = graph.offsets, graph.sources
+    weights = link_weights(graph)
+    ranks = [1 / n] * n
+    iterations = 0
+
+    while True:
+        previous = ranks[:]
+        dangling = sum(ranks[j] for j in graph.dangling)
+        for i in range(n):
+            rank = (1 - damping_factor) / n + damping_factor * (
+                dangling / n + sum(
+                    ranks[j] * weights[j]
+                    for j in sources[offsets[i]:offsets[i + 1]]
+                )
+            )
+            if not weights[i]:
+                dangling += rank - ranks[i]
+            ranks[i] = rank
+        ranks = normalized(ranks)
+        iterations += 1
+        if l1_change(ranks, previous) < tolerance:
+            return ranks, iterations
+
+
+def quadratic_extrapolation(history):
+    """
+    Returns the quadratic extrapolation of the last four power
+    iterates in `history` (Kamvar et al.), which removes the two
+    largest error terms other than the PageRank vector itself, or None
+    if the iterates leave the least-squares problem singular.
+    """
+    x0, x1, x2, x3 = history
+    y1 = [b - a for a, b in zip(x0, x1)]
+    y2 = [b - a for a, b in zip(x0, x2)]
+    y3 = [b - a for a, b in zip(x0, x3)]
+
+    # Least-squares solution of [y1 y2] (g1, g2) = -y3
+    a11 = sum(u * u for u in y1)
+    a12 = sum(u * v for u, v in zip(y1, y2))
+    a22 = sum(v * v for v in y2)
+    b1 = -sum(u * w for u, w in zip(y1, y3))
+    b2 = -sum(v * w for v, w in zip(y2, y3))
+    determinant = a11 * a22 - a12 * a12
+    if not determinant:
+        return None
+    g1 = (b1 * a22 - b2 * a12) / determinant
+    g2 = (a11 * b2 - a12 * b1) / determinant
+
+    return normalized([
+        (g1 + g2 + 1) * a + (g2 + 1) * b + c
+        for a, b, c in zip(x1, x2, x3)
+    ])
+
+
+def extrapolated(graph, damping_factor, tolerance):
+    """
+    Power iteration that, every EXTRAPOLATION_PERIOD iterations, tries
+    a quadratic extrapolation of the last four iterates. The
+    extrapolated ranks are only kept if one more iteration from them
+    changes them less than the last plain iteration did; the check
+    counts as an iteration either way.
+    """
+    n = len(graph)
+    weights = link_weights(graph)
+    history = [[1 / n] * n]
+    iterations = 0
+
+    while True:
+        new_ranks = jacobi_step(graph, history[-1], weights, damping_factor)
+        iterations += 1
+        change = l1_change(new_ranks, history[-1])
+        if change < tolerance:
+            return new_ranks, iterations
+        history = (history + [new_ranks])[-4:]
+
+        if iterations % EXTRAPOLATION_PERIOD or len(history) < 4:
+            continue
+        guess = quadratic_extrapolation(history)
+        if guess is None:
+            continue
+        guess_next = jacobi_step(graph, guess, weights, damping_factor)
+        iterations += 1
+        guess_change = l1_change(guess_next, guess)
+        if guess_change < change:
+            if guess_change < tolerance:
+                return guess_next, iterations
+            history = [guess, guess_next]
+
+
+def adaptive(graph, damping_factor, tolerance):
+    """
+    Power iteration that stops recomputing a page once its rank has
+    changed by less than its share of the tolerance for FREEZE_AFTER
+    iterations in a row; frozen pages still pass their rank along.
+    """
+    n = len(graph)
+    offsets, sources = graph.offsets, graph.sources
+    weights = link_weights(graph)
+    ranks = [1 / n] * n
+    steady = [0] * n
+    active = list(range(n))
+    iterations = 0
+
+    while True:
+        shares = [rank * weight for rank, weight in zip(ranks, weights)]
+        dangling = sum(ranks[j] for j in graph.dangling) / n
+        base = (1 - damping_factor) / n + damping_factor * dangling
+
+        new_ranks = ranks[:]
+        for i in active:
+            new_ranks[i] = base + damping_factor * sum(
+                map(shares.__getitem__, sources[offsets[i]:offsets[i + 1]])
+            )
+        iterations += 1
+
+        change = 0
+        for i in active:
+            difference = abs(new_ranks[i] - ranks[i])
+            change += difference
+            steady[i] = steady[i] + 1 if difference < tolerance / n else 0
+        active = [i for i in active if steady[i] < FREEZE_AFTER]
+
+        ranks = new_ranks
+        if change < tolerance or not active:
+            return normalized(ranks), iterations
+
+
+# Each solver takes a LinkGraph, a damping factor and an L1 tolerance,
+# and returns the ranks as a list in page order along with the number of
+# iterations it took. Solvers stop once the ranks change by less than
+# `tolerance` in total over one iteration.
+SOLVERS = {
+    "jacobi": jacobi,
+    "gauss-seidel": gauss_seidel,
+    "extrapolated": extrapolated,
+    "adaptive": adaptive,
+}
+
+
+def personalized(graph, damping_factor, teleports, tolerance):
+    """
+    Power iteration for several personalized PageRank vectors at once.
+
+    `teleports` is a list of k teleport distributions, each a list in
+    page order summing to 1. The ranks are kept as an N x k matrix
+    stored row by row, so each pass over a page's incoming links updates
+    all k vectors together. A surfer jumps, and leaves a dangling page,
+    according to its own vector's teleport distribution. Returns the k
+    rank lists and the number of iterations, stopping once no vector
+    changes by `tolerance` or more in total.
+    """
+    n = len(graph)
+    k = len(teleports)
+    offsets, sources = graph.offsets, graph.sources
+    weights = link_weights(graph)
+    columns = range(k)
+    jumps = [teleports[c][i] for i in range(n) for c in columns]
+    ranks = jumps[:]
+    iterations = 0
+
+    while True:
+        shares = [rank * weights[p // k] for p, rank in enumerate(ranks)]
+        dangling = [
+            sum(ranks[j * k + c] for j in graph.dangling) for c in columns
+        ]
+        scale = [1 - damping_factor + damping_factor * d for d in dangling]
+
+        new_ranks = []
+        for i in range(n):
+            total = [0] * k
+            for j in sources[offsets[i]:offsets[i + 1]]:
+                total = list(map(add, total, shares[j * k:j * k + k]))
+            new_ranks.extend(
+                jumps[i * k + c] * scale[c] + damping_factor * total[c]
+                for c in columns
+            )
+        iterations += 1
+
+        change = [0] * k
+        for p, (new, old) in enumerate(zip(new_ranks, ranks)):
+            change[p % k] += abs(new - old)
+        ranks = new_ranks
+        if max(change) < tolerance:
+            return [ranks[c::k] for c in columns], iterations